@@ -1,259 +1,126 @@
+import argparse
 import os
-import pickle
-import re
 
+import numpy as np
 import pandas as pd
-import requests
 from tqdm import tqdm
+from enrichment_journal import JOURNAL_FILE, EnrichmentJournal, load_journal
+from figures_table import write_figures
+from wikidata_cache import WikidataCache
+from wikidata_enrichment import WikidataEnricher
+from wikilinks_store import TitleIndex
 
 
-# Function to save the merged DataFrame (Step 1)
-def merge_and_save_data(pagerank_file, people_articles_file, wikilinks_file, merged_output_file, how_many=10000):
-    # Load the pagerank results
-    print("Loading PageRank results...")
-    pagerank_df = pd.read_csv(pagerank_file)
+# Read the PageRank results in chunks, keeping only the `limit` highest scores (partial sort)
+def top_pagerank_candidates(pagerank_file, limit, chunk_size=1000000):
+    top_df = pd.DataFrame(columns=['page_id', 'pagerank_score'])
+    for chunk in pd.read_csv(pagerank_file, chunksize=chunk_size):
+        candidates = pd.concat([top_df, chunk], ignore_index=True) if len(top_df) else chunk.reset_index(drop=True)
+        if len(candidates) > limit:
+            keep = np.argpartition(-candidates['pagerank_score'].to_numpy(), limit - 1)[:limit]
+            candidates = candidates.iloc[keep]
+        top_df = candidates.reset_index(drop=True)
+    return top_df.sort_values(by='pagerank_score', ascending=False)
 
-    # Load the people articles
-    print("Loading people articles...")
-    people_articles_df = pd.read_csv(people_articles_file)
 
-    # Load the wikilinks data (to get the article names)
-    print("Loading wikilinks data...")
-    wikilinks_df = pd.read_csv(wikilinks_file, sep='\t', usecols=['page_id_from', 'page_title_from']).drop_duplicates()
+# Read the people articles in chunks, keeping only the rows whose name is in titles
+def find_people_articles(people_articles_file, titles, chunk_size=1000000):
+    matches = []
+    for chunk in pd.read_csv(people_articles_file, usecols=['article name', 'wikipedia link'], chunksize=chunk_size):
+        matches.append(chunk[chunk['article name'].isin(titles)])
+    return pd.concat(matches, ignore_index=True)
 
-    # Merge pagerank results with article names from the wikilinks data
-    print("Merging PageRank results with article names...")
-    pagerank_with_names_df = pd.merge(pagerank_df, wikilinks_df, left_on='page_id', right_on='page_id_from')
 
-    # Merge with people_articles_df to get the Wikipedia link
-    print("Merging with people articles to get Wikipedia links...")
-    merged_df = pd.merge(pagerank_with_names_df, people_articles_df[['article name', 'wikipedia link']],
-                         left_on='page_title_from', right_on='article name', how='inner')
+# Function to save the merged DataFrame (Step 1)
+def merge_and_save_data(pagerank_file, people_articles_file, wikilinks_file, merged_output_file, how_many=10000):
+    # Most top-ranked pages are places, years and topics, so start from a few times more
+    # candidates than needed and widen the search until enough of them are people
+    title_index = TitleIndex(wikilinks_file)
+    limit = how_many * 4
+    while True:
+        # Load the top pagerank results
+        print(f"Selecting the top {limit} PageRank results...")
+        pagerank_df = top_pagerank_candidates(pagerank_file, limit)
+
+        # Resolve titles for those IDs only, with the binary search index of the wikilinks data
+        print("Looking up article names...")
+        pagerank_with_names_df = pagerank_df.assign(
+            page_id_from=pagerank_df['page_id'],
+            page_title_from=title_index.lookup(pagerank_df['page_id'].to_numpy())
+        ).dropna(subset=['page_title_from'])
+
+        # Merge with the matching people articles to get the Wikipedia link
+        print("Merging with people articles to get Wikipedia links...")
+        people_articles_df = find_people_articles(people_articles_file, set(pagerank_with_names_df['page_title_from']))
+        merged_df = pd.merge(pagerank_with_names_df, people_articles_df,
+                             left_on='page_title_from', right_on='article name', how='inner')
+
+        if len(merged_df) >= how_many or len(pagerank_df) < limit:
+            break
+        limit *= 4
 
     # Sort the merged results by pagerank score in descending order
     print("Sorting results...")
     sorted_df = merged_df.sort_values(by='pagerank_score', ascending=False)
 
-    # Select the top 10,000 rows
-    top_10000_df = sorted_df.head(how_many)
+    # Select the top rows (10,000 unless the pipeline asks for more)
+    top_df = sorted_df.head(how_many)
 
     # Save the merged DataFrame
     print(f"Saving merged data to {merged_output_file}...")
-    top_10000_df.to_csv(merged_output_file, index=False)
+    top_df.to_csv(merged_output_file, index=False)
 
     print("Merge and save completed successfully!")
-    return top_10000_df
+    return top_df
 
 
 # Function to get additional data from Wikidata (Step 2)
-def fetch_wikidata_and_save(merged_input_file, output_file):
+# Several workers can share the journal, each enriching its own shard of the page IDs; the
+# one that completes the set writes the output file.
+def fetch_wikidata_and_save(merged_input_file, output_file, shard=0, num_shards=1):
     # Load the merged data
     print("Loading merged data...")
     top_10000_df = pd.read_csv(merged_input_file)
 
-    def parse_year(date_string):
-        if not date_string:
-            return None
-
-        match = re.match(r'([+-])(\d+)-(\d{2})-(\d{2})', date_string)
-        if match:
-            sign, year, month, day = match.groups()
-            year = int(year)
-            return -year if sign == '-' else year
-        return None
-
-    def format_year(year):
-        if year is None:
-            return None
-        if year < 0:
-            return f"-{abs(year):04d}"  # BC year
-        else:
-            return f"{year:04d}"  # AD year without +
-
-    query_cache = {}
-    def get_wikidata_label(entity_id, language='en'):
-        # Check if the query is in the cache
-        cache_key = (entity_id, language)
-        if cache_key in query_cache:
-            return query_cache[cache_key]
-
-        url = "https://www.wikidata.org/w/api.php"
-        params = {
-            'action': 'wbgetentities',
-            'ids': entity_id,
-            'format': 'json',
-            'props': 'labels',
-            'languages': language
-        }
-
-        response = requests.get(url, params=params)
-        data = response.json()
-
-        result = None
-        if 'entities' in data and entity_id in data['entities']:
-            entity = data['entities'][entity_id]
-            if 'labels' in entity and language in entity['labels']:
-                result = entity['labels'][language]['value']
-
-        # Cache the result
-        query_cache[cache_key] = result
-
-        return result
-
-    # Function to query Wikidata and get the required information
-    def get_wikidata_info(wikipedia_title):
-        url = f'https://www.wikidata.org/w/api.php?action=wbgetentities&sites=enwiki&titles={wikipedia_title}&props=claims|descriptions|labels&languages=en&format=json'
-        response = requests.get(url)
-        data = response.json()
-
-        # Initialize fields
-        birth, death, image_url, description, occupation_names, field_names = None, None, None, None, [], []
-        lat, lon = None, None
-
-        if 'entities' in data:
-            entity = next(iter(data['entities'].values()))
-
-            # Description
-            description = entity.get('descriptions', {}).get('en', {}).get('value')
-
-            # Claims (facts)
-            claims = entity.get('claims', {})
-
-            # Birth and death
-            def get_date(property_id, earliest=True):
-                date_claims = claims.get(property_id, [])
-                years = []
-                for claim in date_claims:
-                    date_value = claim.get('mainsnak', {}).get('datavalue', {}).get('value', {}).get('time')
-                    if date_value:
-                        year = parse_year(date_value)
-                        if year is not None:
-                            years.append(year)
-
-                if years:
-                    selected_year = min(years) if earliest else max(years)
-                    return format_year(selected_year)
-                return None
-
-            birth = get_date('P569', earliest=True)  # Choose earliest birth year
-            death = get_date('P570', earliest=False)  # Choose latest death year
-
-            # Image URL
-            image_url = None
-            if 'P18' in claims:
-                try:
-                    image_url = f"https://commons.wikimedia.org/wiki/Special:FilePath/{claims['P18'][0]['mainsnak']['datavalue']['value']}"
-                except KeyError:
-                    image_url = None
-
-            # Occupation(s) - Resolve IDs to names
-            occupation_names = []
-            if 'P106' in claims:
-                try:
-                    occupation_ids = [claim['mainsnak']['datavalue']['value']['id'] for claim in claims['P106']]
-                    occupation_names = [get_wikidata_label(occ_id) for occ_id in occupation_ids]
-                except KeyError:
-                    occupation_names = []
-
-            # Field(s) of work - Resolve IDs to names
-            field_names = []
-            if 'P101' in claims:
-                try:
-                    field_ids = [claim['mainsnak']['datavalue']['value']['id'] for claim in claims['P101']]
-                    field_names = [get_wikidata_label(field_id) for field_id in field_ids]
-                except KeyError:
-                    field_names = []
-
-            lat, lon = None, None
-
-            def get_location(place_id):
-                try:
-                    geo_response = requests.get(
-                        f'https://www.wikidata.org/wiki/Special:EntityData/{place_id}.json')
-                    geo_data = geo_response.json()
-                    if 'entities' in geo_data and place_id in geo_data['entities']:
-                        geo_claims = geo_data['entities'][place_id].get('claims', {})
-                        if 'P625' in geo_claims:
-                            location = geo_claims['P625'][0]['mainsnak']['datavalue']['value']
-                            return location['latitude'], location['longitude']
-                except (KeyError, IndexError, requests.RequestException):
-                    pass
-                return None, None
-
-            def get_location_from_claims(claims, property_ids):
-                for pid in property_ids:
-                    if pid in claims:
-                        try:
-                            place_id = claims[pid][0]['mainsnak']['datavalue']['value']['id']
-                            lat, lon = get_location(place_id)
-                            if lat is not None and lon is not None:
-                                return lat, lon
-                        except (KeyError, IndexError):
-                            continue
-                return None, None
-
-            # List of properties to check, in order of preference
-            # P20: Place of birth, P19: Place of death, P551: Residence, P27: Country of citizenship,
-            # P937: Work location, P69: Educated at, P119: Place of burial
-            property_ids = ['P119', 'P20', 'P19', 'P551', 'P27', 'P937', 'P69']
-
-            lat, lon = get_location_from_claims(claims, property_ids)
-
-            # If still not found, use directly available geolocation (if any)
-            if lat is None and lon is None and 'P625' in claims:
-                try:
-                    location = claims['P625'][0]['mainsnak']['datavalue']['value']
-                    lat, lon = location['latitude'], location['longitude']
-                except KeyError:
-                    lat, lon = None, None
-
-
-        return birth, death, image_url, description, occupation_names, field_names, lat, lon
-
-    def save_checkpoint(data, processed_rows, filename):
-        with open(filename, 'wb') as f:
-            pickle.dump({'data': data, 'processed_rows': processed_rows}, f)
-
-    def load_checkpoint(filename):
-        if os.path.exists(filename):
-            with open(filename, 'rb') as f:
-                checkpoint = pickle.load(f)
-            return checkpoint['data'], checkpoint['processed_rows']
-        return [], 0
-
-    CHECKPOINT_FILE = 'wikidata_checkpoint.pkl'
-    ROWS_PER_CHECKPOINT = 500
-
-    # Load from checkpoint if it exists
-    additional_data, start_row = load_checkpoint(CHECKPOINT_FILE)
+    ROWS_PER_BLOCK = 500
+
+    # Every enriched figure is appended to the journal as soon as its block is done, so a
+    # resumed (or concurrent) run only enriches the page IDs that are not in it yet
+    journal = EnrichmentJournal(JOURNAL_FILE, fsync_every=ROWS_PER_BLOCK)
+    enriched = journal.load()
+    if enriched:
+        print(f"Resuming: {len(enriched)} figures already in {JOURNAL_FILE}")
+    pending_df = top_10000_df[~top_10000_df['page_id_from'].isin(list(enriched))
+                              & (top_10000_df['page_id_from'] % num_shards == shard)]
 
+    # Enrich ROWS_PER_BLOCK articles at a time: their entities, labels and places are
+    # fetched in batched wbgetentities calls spread over a rate-limited pool of sessions
     print("Fetching additional data from Wikidata...")
-    for index, row in tqdm(top_10000_df.iloc[start_row:].iterrows(), total=top_10000_df.shape[0] - start_row,
-                           desc="Processing articles", initial=start_row):
-        wikipedia_title = row['page_title_from']
-        birth, death, image_url, description, occupation_names, field_names, lat, lon = get_wikidata_info(
-            wikipedia_title)
-
-        additional_data.append({
-            'birth': birth,
-            'death': death,
-            'image_url': image_url,
-            'description': description,
-            'occupation': occupation_names,
-            'field': field_names,
-            'latitude': lat,
-            'longitude': lon
-        })
-
-        # Save checkpoint every ROWS_PER_CHECKPOINT rows
-        if (index + 1) % ROWS_PER_CHECKPOINT == 0:
-            save_checkpoint(additional_data, index + 1, CHECKPOINT_FILE)
-
-    # Save final checkpoint
-    save_checkpoint(additional_data, len(top_10000_df), CHECKPOINT_FILE)
-
-    # Convert additional data to DataFrame
-    additional_data_df = pd.DataFrame(additional_data)
+    titles = pending_df['page_title_from'].tolist()
+    page_ids = pending_df['page_id_from'].tolist()
+    # Lookups already made by earlier runs are served from the local cache
+    cache = WikidataCache()
+    with journal, WikidataEnricher(cache=cache) as enricher, tqdm(total=len(titles), desc="Processing articles") as progress:
+        for block_start in range(0, len(titles), ROWS_PER_BLOCK):
+            block_titles = titles[block_start:block_start + ROWS_PER_BLOCK]
+            block_ids = page_ids[block_start:block_start + ROWS_PER_BLOCK]
+            records = [{'page_id': int(page_id), **data}
+                       for page_id, data in zip(block_ids, enricher.enrich(block_titles))]
+            journal.append(records)
+            enriched.update((record['page_id'], record) for record in records)
+            progress.update(len(block_titles))
+        print(f"Made {enricher.request_count} Wikidata requests (cache hit rate {cache.hit_rate():.1%})")
+    cache.close()
+
+    # Other shards may still be running; pick up whatever they have journaled meanwhile
+    enriched.update(load_journal(JOURNAL_FILE))
+    missing = [page_id for page_id in top_10000_df['page_id_from'] if page_id not in enriched]
+    if missing:
+        print(f"{len(missing)} figures are still being enriched by other shards; not writing {output_file} yet")
+        return
+
+    # Convert additional data to DataFrame, in the order of the merged data
+    additional_data_df = pd.DataFrame([enriched[page_id] for page_id in top_10000_df['page_id_from']]).drop(columns='page_id')
 
     # Combine the original DataFrame with the additional data
     output_df = pd.concat([top_10000_df.reset_index(drop=True), additional_data_df], axis=1)
@@ -269,25 +136,41 @@ def fetch_wikidata_and_save(merged_input_file, output_file):
         'page_id_from': 'page_id'
     })
 
-    # Save the top 10,000 people articles to a CSV file
+    # Save the top 10,000 people articles, with occupation and field as native list columns.
+    # Shards finishing at the same moment may both get here, so each writes its own temporary
+    # file and renames it into place
     print(f"Saving results to {output_file}...")
-    output_df.to_csv(output_file, index=False)
+    temp_file = f'{output_file}.{os.getpid()}.tmp'
+    write_figures(output_df, temp_file)
+    os.replace(temp_file, output_file)
 
-    # Remove the checkpoint file after successful completion
-    if os.path.exists(CHECKPOINT_FILE):
-        os.remove(CHECKPOINT_FILE)
+    # Remove the journal after successful completion (unless another shard already did)
+    try:
+        os.remove(JOURNAL_FILE)
+    except FileNotFoundError:
+        pass
 
     print("Process completed successfully!")
 
 
-pagerank_file = 'pagerank_results.csv'
-people_articles_file = 'wikipedia_people_articles.csv'
-wikilinks_file = 'wikilinks.csv'
-merged_output_file = 'merged_data.csv'
-output_file = 'top_10000_people_articles_backup.csv'
+# Run both steps when used as a script (the functions above can be imported on their own)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shard', type=int, default=0, help="index of this worker's share of the page IDs")
+    parser.add_argument('--num-shards', type=int, default=1, help="number of workers enriching in parallel")
+    parser.add_argument('--how-many', type=int, default=10000, help="number of figures to keep (use build_tiles.py for large sets)")
+    parser.add_argument('--skip-merge', action='store_true', help="reuse an existing merged_data.csv (for sharded workers)")
+    args = parser.parse_args()
+
+    pagerank_file = 'pagerank_results.csv'
+    people_articles_file = 'wikipedia_people_articles.csv'
+    wikilinks_file = 'wikilinks.csv'
+    merged_output_file = 'merged_data.csv'
+    output_file = 'top_10000_people_articles_backup.parquet'
 
-# Step 1: Merge and save
-merge_and_save_data(pagerank_file, people_articles_file, wikilinks_file, merged_output_file)
+    # Step 1: Merge and save
+    if not args.skip_merge:
+        merge_and_save_data(pagerank_file, people_articles_file, wikilinks_file, merged_output_file, args.how_many)
 
-# Step 2: Fetch Wikidata and save
-fetch_wikidata_and_save(merged_output_file, output_file)
\ No newline at end of file
+    # Step 2: Fetch Wikidata and save
+    fetch_wikidata_and_save(merged_output_file, output_file, args.shard, args.num_shards)
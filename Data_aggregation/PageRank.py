@@ -1,51 +1,155 @@
 import pandas as pd
 import numpy as np
 import igraph as ig
-from tqdm import tqdm
-from collections import defaultdict
+import argparse
+import resource
+import sys
+import os
+import time
+from wikilinks_store import EdgeCollector, LinkFilter, TitleIndex, scan_links, save_filtered_links
 
 # Parameters
 chunk_size = 1000000  # Number of rows to process at once
+iteration_chunk_size = 50000000  # Number of edges pushed at once by the incremental power iteration
 beta = 0.85  # Damping factor for PageRank
+tolerance = 1e-10  # L1 change at which the incremental power iteration stops
+max_iterations = 200
 output_file = 'pagerank_results.csv'  # Output file for PageRank results
+edges_file = 'pagerank_edges.npy'  # Sorted (page_id_from << 32 | page_id_to) keys of the last run's links
+people_articles_file = 'wikipedia_people_articles.csv'  # People articles whose mutual links are kept
+person_links_file = 'person_links.npz'  # Links between people articles, used by filterWikilinksByFigure.py
 
-# Initialize lists to hold the data
-edges = []
-id_map = {}
-reverse_id_map = {}
-current_id = 0
-
-# Reading the file in chunks
-for chunk in tqdm(pd.read_csv('wikilinks.csv', sep='\t', chunksize=chunk_size), desc="Reading data"):
-    for from_id, to_id in zip(chunk['page_id_from'], chunk['page_id_to']):
-        # Map original IDs to consecutive integers
-        if from_id not in id_map:
-            id_map[from_id] = current_id
-            reverse_id_map[current_id] = from_id
-            current_id += 1
-        if to_id not in id_map:
-            id_map[to_id] = current_id
-            reverse_id_map[current_id] = to_id
-            current_id += 1
-
-        # Add edge using mapped IDs
-        edges.append((id_map[from_id], id_map[to_id]))
-
-print("Creating graph...")
-# Create the graph
-graph = ig.Graph(edges=edges, directed=True)
-
-print("Computing PageRank...")
-# Compute PageRank using igraph's implementation
-pagerank_scores = graph.pagerank(damping=beta, implementation="prpack")
+parser = argparse.ArgumentParser()
+parser.add_argument('--incremental', action='store_true',
+                    help="warm-start from the previous results and edge set instead of recomputing from scratch "
+                         "(manual only: pipeline.py always recomputes)")
+parser.add_argument('--save-edges', action='store_true',
+                    help="save the sorted edge set, so later --incremental runs can diff against it "
+                         "(always done with --incremental)")
+args = parser.parse_args()
+
+def peak_memory_mb():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def report(step, start_time):
+    print(f"{step} took {time.time() - start_time:.1f}s (peak memory {peak_memory_mb():.0f} MB)")
+
+def count_known_edges(edge_keys, previous_keys):
+    # Both arrays are sorted and unique, so membership is a chunked binary search
+    if len(previous_keys) == 0:
+        return 0
+    known = 0
+    for start in range(0, len(edge_keys), chunk_size):
+        keys = edge_keys[start:start + chunk_size]
+        positions = np.minimum(np.searchsorted(previous_keys, keys), len(previous_keys) - 1)
+        known += int(np.count_nonzero(previous_keys[positions] == keys))
+    return known
+
+def power_iteration(from_ids, to_ids, n, initial_scores):
+    # Same model as igraph's PageRank: dangling pages and random jumps spread uniformly
+    out_degree = np.bincount(from_ids, minlength=n)
+    inv_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=out_degree > 0)
+    dangling = out_degree == 0
+    scores = initial_scores / initial_scores.sum()
+    residual = np.inf
+    for iteration in range(1, max_iterations + 1):
+        weights = scores * inv_degree
+        flow = np.zeros(n)
+        for start in range(0, len(from_ids), iteration_chunk_size):
+            end = start + iteration_chunk_size
+            flow += np.bincount(to_ids[start:end], weights=weights[from_ids[start:end]], minlength=n)
+        new_scores = beta * flow + (1.0 - beta + beta * scores[dangling].sum()) / n
+        residual = np.abs(new_scores - scores).sum()
+        scores = new_scores
+        print(f"Iteration {iteration}: L1 change {residual:.3e}")
+        if residual < tolerance:
+            break
+    return scores, iteration, residual
+
+# Scan the memory-mapped binary copy of wikilinks.csv (converted on first use) once:
+# copy the raw page IDs into int32 arrays that can be remapped in place, and keep
+# the links between people articles so the figure link filter needs no second scan
+start_time = time.time()
+stages = [EdgeCollector()]
+if os.path.exists(people_articles_file):
+    people_names = pd.read_csv(people_articles_file, usecols=['article name'])['article name']
+    stages.append(LinkFilter(TitleIndex().find_ids(people_names)))
+results = scan_links(stages)
+from_ids, to_ids = results[0]
+if len(results) > 1:
+    save_filtered_links(person_links_file, *results[1])
+    print(f"Saved {len(results[1][0])} links between people articles to {person_links_file}")
+report("Reading data", start_time)
+
+# Snapshot of this run's edge set, so the next incremental run can diff against it; sorting
+# every edge is costly, so it is only built when an incremental run will use it
+save_edges = args.incremental or args.save_edges
+if save_edges:
+    start_time = time.time()
+    edge_keys = np.unique((from_ids.astype(np.int64) << 32) | to_ids)
+    report("Building edge snapshot", start_time)
+
+# Map original IDs to consecutive integers: the sorted unique IDs are the reverse map,
+# and each ID's position in that array (found by binary search) is its vertex number
+start_time = time.time()
+reverse_id_map = np.union1d(np.unique(from_ids), np.unique(to_ids))
+for ids in (from_ids, to_ids):
+    for start in range(0, len(ids), chunk_size):
+        ids[start:start + chunk_size] = np.searchsorted(reverse_id_map, ids[start:start + chunk_size])
+report("Remapping IDs", start_time)
+
+if args.incremental and os.path.exists(output_file) and os.path.exists(edges_file):
+    # Diff the edge set against the last run
+    start_time = time.time()
+    previous_keys = np.load(edges_file, mmap_mode='r')
+    known = count_known_edges(edge_keys, previous_keys)
+    added, removed = len(edge_keys) - known, len(previous_keys) - known
+    print(f"Edge changes since the last run: {added} added, {removed} removed")
+
+    # Warm start from the previous scores; new pages start from the uniform score
+    previous_df = pd.read_csv(output_file)
+    previous_scores = pd.Series(previous_df['pagerank_score'].to_numpy(), index=previous_df['page_id'].to_numpy())
+    initial_scores = previous_scores.reindex(reverse_id_map).fillna(1.0 / len(reverse_id_map)).to_numpy()
+    report("Loading previous results", start_time)
+
+    start_time = time.time()
+    if added == 0 and removed == 0 and len(previous_df) == len(reverse_id_map):
+        print("Link graph unchanged, reusing the previous PageRank scores.")
+        pagerank_scores = initial_scores
+    else:
+        print("Computing PageRank incrementally...")
+        pagerank_scores, iterations, residual = power_iteration(from_ids, to_ids, len(reverse_id_map), initial_scores)
+        status = "Converged" if residual < tolerance else "Did not converge"
+        print(f"{status} after {iterations} iterations (L1 change {residual:.3e})")
+    report("Computing PageRank", start_time)
+else:
+    print("Creating graph...")
+    # Create the graph straight from the int32 edge array
+    start_time = time.time()
+    graph = ig.Graph(n=len(reverse_id_map), edges=np.column_stack((from_ids, to_ids)), directed=True)
+    report("Creating graph", start_time)
+
+    print("Computing PageRank...")
+    # Compute PageRank using igraph's implementation
+    start_time = time.time()
+    pagerank_scores = graph.pagerank(damping=beta, implementation="prpack")
+    report("Computing PageRank", start_time)
 
 # Create a DataFrame with the results, mapping back to original IDs
 pagerank_df = pd.DataFrame({
-    'page_id': [reverse_id_map[i] for i in range(graph.vcount())],
+    'page_id': reverse_id_map,
     'pagerank_score': pagerank_scores
 })
 
-# Save the PageRank results to a CSV file
+# Save the PageRank results to a CSV file, and the edge set they were computed on. The old
+# snapshot goes first: it no longer matches the new results, and an incremental run that
+# found it next to them would take them for scores of that edge set
+if os.path.exists(edges_file):
+    os.remove(edges_file)
 pagerank_df.to_csv(output_file, index=False)
+if save_edges:
+    np.save(edges_file, edge_keys)
 
-print(f"PageRank computation complete. Results saved to {output_file}.")
\ No newline at end of file
+print(f"PageRank computation complete. Results saved to {output_file}.")
@@ -0,0 +1,84 @@
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+import time
+from figures_table import read_figures_table, link_arrays
+
+# Parameters
+beta = 0.85  # Damping factor for PageRank
+tolerance = 1e-10  # Largest L1 change of any topic vector at which the iteration stops
+max_iterations = 200
+top_occupations = 50  # Number of most common occupations that get their own ranking
+input_file = 'top_10000_people_articles.parquet'
+output_file = 'occupation_ranks.csv'  # One row per (figure, occupation) the figure holds
+
+def topic_pagerank(from_rows, to_rows, teleport):
+    # Power iteration on all topic vectors at once: every column of scores is one
+    # occupation, and random jumps (and dead ends) only land on that occupation's figures
+    n = teleport.shape[0]
+    out_degree = np.bincount(from_rows, minlength=n)
+    inv_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=out_degree > 0)
+    dangling = out_degree == 0
+
+    # Sparse link matrix, built once and transposed so that one product pushes every topic's
+    # scores along the links (duplicate links add up, as they count in the out-degree)
+    incoming = sp.csr_matrix((np.ones(len(from_rows)), (to_rows, from_rows)), shape=(n, n))
+
+    scores = teleport.copy()
+    for iteration in range(1, max_iterations + 1):
+        flow = incoming @ (scores * inv_degree[:, None])
+        new_scores = beta * flow + teleport * (1.0 - beta + beta * scores[dangling].sum(axis=0))
+        residual = np.abs(new_scores - scores).sum(axis=0).max()
+        scores = new_scores
+        if residual < tolerance:
+            break
+    print(f"Topic PageRank finished after {iteration} iterations (largest L1 change {residual:.3e})")
+    return scores
+
+start_time = time.time()
+
+# Load the figures, their occupations and the links between them
+print(f"Loading {input_file}...")
+table = read_figures_table(input_file, columns=['page_id', 'occupation', 'outgoing_link_ids'])
+figures = table.select(['page_id', 'occupation']).to_pandas()
+link_counts, link_targets = link_arrays(table)
+
+# Map page IDs to row numbers and keep the links that stay inside the figure set
+page_ids = figures['page_id'].to_numpy()
+row_of = pd.Series(np.arange(len(figures)), index=page_ids)
+from_rows = np.repeat(np.arange(len(figures)), link_counts)
+to_rows = row_of.reindex(link_targets).to_numpy()
+known = ~np.isnan(to_rows)
+from_rows, to_rows = from_rows[known], to_rows[known].astype(np.int64)
+
+# The most common occupations, in the same order as get_unique_occupations
+occupation_rows = figures[['occupation']].explode('occupation').dropna()
+occupation_rows = occupation_rows[occupation_rows['occupation'] != '']
+occupations = occupation_rows['occupation'].value_counts().index[:top_occupations].tolist()
+print(f"Computing topic-sensitive PageRank for {len(occupations)} occupations...")
+
+# Teleport matrix: column k is uniform over the figures holding occupation k
+teleport = np.zeros((len(figures), len(occupations)))
+for k, occupation in enumerate(occupations):
+    members = occupation_rows.index[occupation_rows['occupation'] == occupation].unique()
+    teleport[members, k] = 1.0 / len(members)
+
+scores = topic_pagerank(from_rows, to_rows, teleport)
+
+# Keep each occupation's members, ranked by that occupation's score, with a color
+# value normalized like the global one (1 for the first figure, 0 for the last)
+results = []
+for k, occupation in enumerate(occupations):
+    members = np.flatnonzero(teleport[:, k])
+    ranked = members[np.argsort(-scores[members, k], kind='stable')]
+    results.append(pd.DataFrame({
+        'page_id': page_ids[ranked],
+        'occupation': occupation,
+        'topic_pagerank_score': scores[ranked, k],
+        'color_value': 1.0 - np.arange(len(ranked)) / max(len(ranked) - 1, 1)
+    }))
+
+occupation_ranks = pd.concat(results, ignore_index=True)
+occupation_ranks.to_csv(output_file, index=False)
+
+print(f"Saved {len(occupation_ranks)} occupation ranks to {output_file} in {time.time() - start_time:.1f}s")
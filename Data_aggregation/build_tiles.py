@@ -0,0 +1,130 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+from figures_table import read_figures
+
+# Pre-tiled point data for the app's scale mode (src/tiles.py), for figure sets far too
+# large to send to the browser as one trace. For every zoom level and century, the figures
+# alive at some point in that century are bucketed into Web Mercator tiles, and every tile
+# keeps its TILE_CAPACITY most important figures, ranked by pagerank_score. A (zoom,
+# century) bucket is three memory-mappable .npy files: the points of all its tiles one
+# after another, the sorted keys of the tiles (x * 2**zoom + y) and their offsets.
+input_file = 'top_10000_people_articles.parquet'
+output_dir = 'tiles'
+MAX_ZOOM = 7
+TILE_CAPACITY = 2000
+CENTURY = 100
+MAX_LATITUDE = 85.0511  # Edge of the Web Mercator square
+ALIVE = np.iinfo(np.int16).max  # Death year of figures still alive
+
+# One point: its row in the names (and rank, 0 = most important), position and lifespan
+POINT_DTYPE = np.dtype([('row', '<i4'), ('lat', '<f4'), ('lon', '<f4'), ('birth', '<i2'), ('death', '<i2')])
+
+
+def tile_coordinates(lat, lon, zoom):
+    # Web Mercator tile of every point at `zoom`
+    n = 2 ** zoom
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((lon + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def load_points(path, current_year):
+    # Figures that can be placed on the map, most important first (row = rank)
+    df = read_figures(path, columns=['page_id', 'article_name', 'pagerank_score', 'birth', 'death', 'latitude', 'longitude'])
+    df = df.dropna(subset=['birth', 'latitude', 'longitude'])
+    df = df.sort_values('pagerank_score', ascending=False, kind='stable').reset_index(drop=True)
+
+    points = np.zeros(len(df), dtype=POINT_DTYPE)
+    points['row'] = np.arange(len(df))
+    points['lat'] = df['latitude'].to_numpy(dtype=float)
+    points['lon'] = df['longitude'].to_numpy(dtype=float)
+    points['birth'] = np.clip(df['birth'].to_numpy(dtype=float), -ALIVE + 1, current_year)
+    # A death of NULL or 0 means still alive (as in get_figures_for_year)
+    deaths = df['death'].to_numpy(dtype=float, na_value=np.nan)
+    points['death'] = np.where(np.isnan(deaths) | (deaths == 0), ALIVE, np.clip(deaths, -ALIVE + 1, current_year))
+    return df, points
+
+
+def write_names(df, directory):
+    # Names and page IDs by row, stored like the title dictionary of wikilinks_store.py
+    encoded = [name.encode('utf-8') for name in df['article_name'].astype(str)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in encoded], out=offsets[1:])
+    with open(os.path.join(directory, 'names.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(os.path.join(directory, 'name_offsets.npy'), offsets)
+    np.save(os.path.join(directory, 'page_ids.npy'), df['page_id'].to_numpy(dtype=np.int64))
+
+
+def build_tiles(input_path, directory, max_zoom=MAX_ZOOM, capacity=TILE_CAPACITY):
+    current_year = datetime.date.today().year
+    df, points = load_points(input_path, current_year)
+
+    # Every figure is listed in each century its life overlaps
+    first = np.floor_divide(points['birth'].astype(np.int64), CENTURY)
+    last = np.floor_divide(np.minimum(points['death'], current_year).astype(np.int64), CENTURY)
+    last = np.maximum(last, first)
+    spans = last - first + 1
+    members = np.repeat(np.arange(len(points)), spans)
+    centuries = np.repeat(first, spans) + (np.arange(len(members)) - np.repeat(np.cumsum(spans) - spans, spans))
+
+    # Build in a separate directory, so a failed run leaves the previous tiles in place
+    temp_dir = directory + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    write_names(df, temp_dir)
+
+    buckets = 0
+    for zoom in range(max_zoom + 1):
+        x, y = tile_coordinates(points['lat'], points['lon'], zoom)
+        keys = (x * 2 ** zoom + y)[members]
+        # Sorted by century, then tile, then rank (members are in rank order)
+        order = np.lexsort((members, keys, centuries))
+        sorted_centuries, sorted_keys = centuries[order], keys[order]
+
+        # Position of every point within its (century, tile) run; keep the top `capacity`
+        starts = np.flatnonzero(np.r_[True, (sorted_centuries[1:] != sorted_centuries[:-1])
+                                      | (sorted_keys[1:] != sorted_keys[:-1])])
+        lengths = np.diff(np.r_[starts, len(order)])
+        position = np.arange(len(order)) - np.repeat(starts, lengths)
+        keep = position < capacity
+        order, sorted_centuries, sorted_keys = order[keep], sorted_centuries[keep], sorted_keys[keep]
+
+        zoom_dir = os.path.join(temp_dir, f'z{zoom}')
+        os.makedirs(zoom_dir)
+        bounds = np.flatnonzero(np.r_[True, sorted_centuries[1:] != sorted_centuries[:-1], True])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            tile_keys, tile_starts = np.unique(sorted_keys[start:end], return_index=True)
+            offsets = np.append(tile_starts, end - start).astype(np.int64)
+            prefix = os.path.join(zoom_dir, f'c{sorted_centuries[start]}')
+            np.save(prefix + '.points.npy', points[members[order[start:end]]])
+            np.save(prefix + '.keys.npy', tile_keys)
+            np.save(prefix + '.offsets.npy', offsets)
+            buckets += 1
+        print(f"Zoom {zoom}: {len(order)} points in {len(bounds) - 1} centuries")
+
+    with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+        json.dump({'figures': len(points), 'max_zoom': max_zoom, 'tile_capacity': capacity,
+                   'century': CENTURY, 'alive': int(ALIVE)}, f)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temp_dir, directory)
+    print(f"Wrote {buckets} tile buckets for {len(points)} figures to {directory}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default=input_file, help="aggregated figures (Parquet, or CSV of the same name)")
+    parser.add_argument('--output', default=output_dir)
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--tile-capacity', type=int, default=TILE_CAPACITY, help="most figures kept per tile")
+    args = parser.parse_args()
+
+    build_tiles(args.input, args.output, args.max_zoom, args.tile_capacity)
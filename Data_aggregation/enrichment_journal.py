@@ -0,0 +1,64 @@
+import json
+import os
+
+# Append-only, line-oriented record of enriched figures, keyed by page_id. Every record is
+# written with a single O_APPEND write, so several workers can share one journal, and a
+# resumed run only has to skip the page IDs that are already in it.
+JOURNAL_FILE = 'wikidata_journal.jsonl'
+
+
+def load_journal(path=JOURNAL_FILE):
+    # All complete records, by page_id (a later record for the same page wins); reads only,
+    # so it can be called while other workers append, or after one removed the journal
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Partial line from an interrupted write
+            records[record['page_id']] = record
+    return records
+
+
+class EnrichmentJournal:
+    def __init__(self, path=JOURNAL_FILE, fsync_every=500):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.unsynced = 0
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+        # A crash can leave a half-written last line; end it so the next record starts clean
+        if os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    os.write(self.fd, b'\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load(self):
+        return load_journal(self.path)
+
+    def append(self, records):
+        for record in records:
+            os.write(self.fd, (json.dumps(record) + '\n').encode('utf-8'))
+            self.unsynced += 1
+        if self.unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.fd)
+        self.unsynced = 0
+
+    def close(self):
+        if self.fd is not None:
+            self.sync()
+            os.close(self.fd)
+            self.fd = None
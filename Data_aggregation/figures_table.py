@@ -0,0 +1,100 @@
+import argparse
+import ast
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# The figures move between the aggregation stages as Parquet files, with occupation and
+# field stored as native lists of strings, outgoing_link_ids as a native list of page IDs
+# and the years as nullable integers, so every reader loads typed columns without parsing.
+# CSV files written by older runs (stringified lists) can still be read, and converted.
+LIST_COLUMNS = {
+    'occupation': pa.list_(pa.string()),
+    'field': pa.list_(pa.string()),
+    'outgoing_link_ids': pa.list_(pa.int64()),
+}
+YEAR_COLUMNS = ['birth', 'death']
+
+
+def csv_path(path):
+    return os.path.splitext(path)[0] + '.csv'
+
+
+def parse_legacy_list(value):
+    # "['painter', 'writer']" (Wikidata labels) or "12,345,678" (link IDs) from older CSVs
+    if not isinstance(value, str) or not value:
+        return []
+    if value.startswith('['):
+        try:
+            return [item for item in ast.literal_eval(value) if item is not None]
+        except (ValueError, SyntaxError):
+            return []
+    return [int(i) for i in value.split(',') if i]
+
+
+def as_list(value):
+    if isinstance(value, str):
+        return parse_legacy_list(value)
+    if value is None:
+        return []
+    if np.ndim(value) == 0:
+        # A link list with a single ID is read from CSV as a number
+        return [] if pd.isna(value) else [int(value)]
+    return list(value)
+
+
+def figures_to_table(df):
+    # Arrow table with native list columns (missing lists become empty ones) and int years
+    df = df.copy()
+    for name in YEAR_COLUMNS:
+        if name in df.columns:
+            df[name] = pd.to_numeric(df[name], errors='coerce').astype('Int64')
+    columns = {}
+    for name in df.columns:
+        if name in LIST_COLUMNS:
+            columns[name] = pa.array([as_list(value) for value in df[name]], type=LIST_COLUMNS[name])
+        else:
+            columns[name] = pa.Array.from_pandas(df[name])
+    return pa.table(columns)
+
+
+def write_figures(figures, path):
+    table = figures if isinstance(figures, pa.Table) else figures_to_table(figures)
+    pq.write_table(table, path)
+
+
+def read_figures_table(path, columns=None):
+    # Only the requested columns are read from a Parquet file
+    if os.path.exists(path) and path.endswith('.parquet'):
+        return pq.read_table(path, columns=columns)
+    df = pd.read_csv(csv_path(path), usecols=columns)
+    return figures_to_table(df)
+
+
+def read_figures(path, columns=None):
+    # List columns come back as NumPy arrays, one per row
+    return read_figures_table(path, columns).to_pandas()
+
+
+def link_arrays(table):
+    # Number of outgoing links of every row, and all link targets as one flat array
+    links = table.column('outgoing_link_ids')
+    counts = pc.fill_null(pc.list_value_length(links), 0).to_numpy()
+    targets = pc.list_flatten(links).to_numpy()
+    return counts, targets
+
+
+if __name__ == '__main__':
+    # Convert a figures CSV from an older run (e.g. the app's data file) to Parquet
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', help="figures CSV with stringified list columns")
+    parser.add_argument('output', nargs='?', help="Parquet file (default: next to the input)")
+    args = parser.parse_args()
+
+    output_file = args.output or os.path.splitext(args.input)[0] + '.parquet'
+    write_figures(pd.read_csv(args.input), output_file)
+    print(f"Converted {args.input} to {output_file}")
@@ -1,41 +1,54 @@
-import pandas as pd
-from tqdm import tqdm
-from collections import defaultdict
+import argparse
+import numpy as np
+import pyarrow as pa
+from figures_table import read_figures_table, write_figures
+from wikilinks_store import (LinkFilter, scan_links, filter_links, group_links,
+                             load_filtered_links, is_newer_than_links)
+
+# Links between people articles, saved by the PageRank scan of the same pipeline run
+person_links_file = 'person_links.npz'
+
+# The figures are updated in place unless an output file is given (pipeline.py keeps the
+# enriched figures and the figures with their links in separate files)
+parser = argparse.ArgumentParser()
+parser.add_argument('--input', default='top_10000_people_articles.parquet')
+parser.add_argument('--output', default=None)
+args = parser.parse_args()
+output_file = args.output or args.input
 
 # Read the top 10000 people articles
-top_articles = pd.read_csv('top_10000_people_articles.csv')
-top_page_ids = set(top_articles['page_id'])
-
-# Create a dictionary to store outgoing links for each page_id
-outgoing_links = {}  # Changed from defaultdict(set) to regular dict
-
-# Set the chunk size
-chunk_size = 100000  # Adjust this based on your available memory
-
-# Read and process the large file in chunks
-print("Processing wikilinks.csv...")
-for chunk in tqdm(pd.read_csv('wikilinks.csv', sep='\t', chunksize=chunk_size), desc="Processing data"):
-    # Filter the chunk for rows where both page_id_from and page_id_to are in top_page_ids
-    filtered_chunk = chunk[chunk['page_id_from'].isin(top_page_ids) & chunk['page_id_to'].isin(top_page_ids)]
-    
-    # Update the outgoing_links dictionary
-    for _, row in filtered_chunk.iterrows():
-        if row['page_id_from'] not in outgoing_links:
-            outgoing_links[row['page_id_from']] = set()
-        outgoing_links[row['page_id_from']].add(str(row['page_id_to']))
-
-# Convert sets to comma-separated strings, only for non-empty sets
-for page_id in outgoing_links:
-    if outgoing_links[page_id]:  # Only process non-empty sets
-        outgoing_links[page_id] = ','.join(outgoing_links[page_id])
-    else:
-        del outgoing_links[page_id]  # Remove empty sets from the dictionary
-
-# Add the new column to top_articles DataFrame
-print("Updating top_10000_people_articles.csv...")
-top_articles['outgoing_link_ids'] = top_articles['page_id'].map(outgoing_links)
-
-# Save the updated DataFrame
-top_articles.to_csv('top_10000_people_articles.csv', index=False)
-
-print("Update complete. Results saved in 'top_10000_people_articles.csv'")
\ No newline at end of file
+top_articles = read_figures_table(args.input)
+page_ids = top_articles.column('page_id').to_numpy()
+top_page_ids = np.unique(page_ids)
+
+# Reuse the links the PageRank scan already kept, or scan the link arrays once otherwise
+if is_newer_than_links(person_links_file):
+    print(f"Filtering links from {person_links_file}...")
+    from_ids, to_ids = filter_links(*load_filtered_links(person_links_file), top_page_ids)
+else:
+    print("Processing wikilinks...")
+    from_ids, to_ids = scan_links([LinkFilter(top_page_ids)])[0]
+
+# Group the sorted links into CSR offsets, then gather every figure's targets in row order
+# into the offsets and values of a native list column
+sources, offsets, targets = group_links(from_ids, to_ids)
+positions = np.searchsorted(sources, page_ids)
+found = positions < len(sources)
+found[found] = sources[positions[found]] == page_ids[found]
+starts = offsets[positions]
+counts = np.where(found, offsets[np.minimum(positions + 1, len(sources))] - starts, 0)
+row_offsets = np.zeros(len(page_ids) + 1, dtype=np.int32)
+np.cumsum(counts, out=row_offsets[1:])
+gather = np.repeat(starts - row_offsets[:-1], counts) + np.arange(row_offsets[-1])
+outgoing_links = pa.ListArray.from_arrays(row_offsets, targets[gather].astype(np.int64))
+
+# Add the new column to the figures
+print(f"Updating {output_file}...")
+if 'outgoing_link_ids' in top_articles.column_names:
+    top_articles = top_articles.drop(['outgoing_link_ids'])
+top_articles = top_articles.append_column('outgoing_link_ids', outgoing_links)
+
+# Save the updated figures
+write_figures(top_articles, output_file)
+
+print(f"Update complete. Results saved in '{output_file}'")
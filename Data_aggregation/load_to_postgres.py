@@ -0,0 +1,176 @@
+import argparse
+import csv
+import io
+import os
+import time
+
+import pandas as pd
+import psycopg2
+from psycopg2 import sql
+from dotenv import load_dotenv
+from csv_to_sql_format import input_file, prepare_sql_frame
+
+# Load the aggregated figures (and optionally the per-occupation ranks) into Postgres.
+# Rows are streamed with COPY FROM STDIN into staging tables, indexed there, and swapped in
+# for the live tables in one transaction, so the app never sees a half-loaded table or
+# tables from two different loads. Grants on the live tables are carried over to the new
+# ones; views on them are not supported, as the old tables are dropped.
+COPY_CHUNK_ROWS = 5000
+
+TOP_FIGURES_COLUMNS = [
+    ('page_id', 'bigint PRIMARY KEY'),
+    ('article_name', 'text NOT NULL'),
+    ('pagerank_score', 'double precision'),
+    ('wikipedia_link', 'text'),
+    ('birth', 'integer'),
+    ('death', 'integer'),
+    ('image_url', 'text'),
+    ('description', 'text'),
+    ('occupation', 'jsonb'),
+    ('field', 'jsonb'),
+    ('latitude', 'double precision'),
+    ('longitude', 'double precision'),
+    ('outgoing_link_ids', 'bigint[]'),
+    ('color_value', 'double precision'),
+]
+
+# No secondary indexes: the app loads the table whole into memory (src/figure_table.py),
+# where masks over the year, occupation and lifespan arrays replace the SQL filters, and
+# then only looks up texts by page_id, which the primary key serves
+TOP_FIGURES_INDEXES = []
+
+OCCUPATION_RANKS_COLUMNS = [
+    ('page_id', 'bigint NOT NULL'),
+    ('occupation', 'text NOT NULL'),
+    ('topic_pagerank_score', 'double precision'),
+    ('color_value', 'double precision'),
+]
+
+# Read whole by the app as well
+OCCUPATION_RANKS_INDEXES = []
+
+
+class CsvStream(io.RawIOBase):
+    # File-like view of a DataFrame as CSV, encoded a chunk of rows at a time for COPY
+    def __init__(self, df, chunk_rows=COPY_CHUNK_ROWS):
+        self.df = df
+        self.chunk_rows = chunk_rows
+        self.position = 0
+        self.buffer = b''
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        # Short reads are fine for COPY; an empty result means the end of the data
+        if self.offset == len(self.buffer):
+            if self.position >= len(self.df):
+                return b''
+            chunk = self.df.iloc[self.position:self.position + self.chunk_rows]
+            self.buffer = chunk.to_csv(index=False, header=False, quoting=csv.QUOTE_MINIMAL, na_rep='').encode('utf-8')
+            self.offset = 0
+            self.position += self.chunk_rows
+        end = len(self.buffer) if size is None or size < 0 else self.offset + size
+        data = self.buffer[self.offset:end]
+        self.offset += len(data)
+        return data
+
+
+def dependent_views(cur, table):
+    # Views reading public.<table>; they would keep the old table from being dropped
+    cur.execute("""
+        SELECT DISTINCT view.oid::regclass::text
+        FROM pg_depend dependency
+        JOIN pg_rewrite rewrite ON rewrite.oid = dependency.objid
+        JOIN pg_class view ON view.oid = rewrite.ev_class
+        WHERE dependency.refobjid = to_regclass(%s) AND view.oid <> dependency.refobjid
+    """, [f'public.{table}'])
+    return [name for (name,) in cur.fetchall()]
+
+
+def table_grants(cur, table):
+    # Privileges other roles hold on public.<table>; they are dropped along with it
+    cur.execute("""
+        SELECT CASE WHEN acl.grantee = 0 THEN 'PUBLIC' ELSE pg_get_userbyid(acl.grantee) END,
+               acl.privilege_type, acl.is_grantable
+        FROM pg_class, aclexplode(pg_class.relacl) acl
+        WHERE pg_class.oid = to_regclass(%s) AND acl.grantee <> pg_class.relowner
+    """, [f'public.{table}'])
+    return cur.fetchall()
+
+
+def stage_table(cur, table, columns, indexes, df):
+    # Build public.<table>_staging from df
+    staging = f'{table}_staging'
+    names = [name for name, _ in columns]
+    cur.execute(f"DROP TABLE IF EXISTS public.{staging}")
+    cur.execute(f"CREATE TABLE public.{staging} ({', '.join(f'{name} {kind}' for name, kind in columns)})")
+
+    start_time = time.time()
+    cur.copy_expert(f"COPY public.{staging} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)", CsvStream(df[names]))
+    print(f"Copied {len(df)} rows into {staging} in {time.time() - start_time:.1f}s")
+
+    start_time = time.time()
+    for suffix, definition in indexes:
+        cur.execute(f"CREATE INDEX {staging}_{suffix} ON public.{staging} {definition}")
+    cur.execute(f"ANALYZE public.{staging}")
+    print(f"Built {len(indexes)} indexes on {staging} in {time.time() - start_time:.1f}s")
+
+
+def swap_table(cur, table, indexes):
+    # Replace public.<table> with its staging table, keeping the old table's grants
+    staging = f'{table}_staging'
+    grants = table_grants(cur, table)
+    cur.execute(f"DROP TABLE IF EXISTS public.{table}")
+    cur.execute(f"ALTER TABLE public.{staging} RENAME TO {table}")
+    cur.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass", [f'public.{table}'])
+    for (constraint,) in cur.fetchall():
+        cur.execute(f"ALTER TABLE public.{table} RENAME CONSTRAINT {constraint} TO {constraint.replace(staging, table, 1)}")
+    for suffix, _ in indexes:
+        cur.execute(f"ALTER INDEX public.{staging}_{suffix} RENAME TO {table}_{suffix}")
+    for grantee, privilege, grantable in grants:
+        role = 'PUBLIC' if grantee == 'PUBLIC' else sql.Identifier(grantee).as_string(cur)
+        cur.execute(f"GRANT {privilege} ON public.{table} TO {role}{' WITH GRANT OPTION' if grantable else ''}")
+
+
+def load_tables(conn, loads):
+    # Load every (table, columns, indexes, df) and swap all the tables in together, so the
+    # app never sees tables from two different loads
+    with conn.cursor() as cur:
+        views = [view for table, _, _, _ in loads for view in dependent_views(cur, table)]
+        if views:
+            raise RuntimeError(f"Views depend on the tables being replaced ({', '.join(views)}); "
+                               "drop them before loading and recreate them afterwards")
+
+        for table, columns, indexes, df in loads:
+            stage_table(cur, table, columns, indexes, df)
+
+        # The swap only waits for queries still reading the old tables; everything above
+        # happened in tables no one else can see yet
+        for table, _, indexes, _ in loads:
+            swap_table(cur, table, indexes)
+    conn.commit()
+    for table, _, _, df in loads:
+        print(f"public.{table} now holds {len(df)} rows")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default=input_file, help="aggregated figures CSV (as read by csv_to_sql_format.py)")
+    parser.add_argument('--occupation-ranks', default='occupation_ranks.csv', help="output of TopicPageRank.py, loaded if it exists")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+
+    df = prepare_sql_frame(args.input).rename(columns={'wikipedia link': 'wikipedia_link'})
+    loads = [('top_figures', TOP_FIGURES_COLUMNS, TOP_FIGURES_INDEXES, df)]
+
+    if os.path.exists(args.occupation_ranks):
+        ranks_df = pd.read_csv(args.occupation_ranks)
+        loads.append(('occupation_ranks', OCCUPATION_RANKS_COLUMNS, OCCUPATION_RANKS_INDEXES, ranks_df))
+
+    load_tables(conn, loads)
+
+    conn.close()
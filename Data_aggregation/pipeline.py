@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+# Runs the aggregation scripts as a pipeline, from the Data_aggregation directory.
+# Every stage declares the files it reads and writes; a stage is skipped when the content
+# hashes of its inputs (and of its own script and arguments) match the last successful
+# run and its outputs are still the files that run wrote. Stages whose inputs are ready
+# run side by side in separate processes.
+STATE_FILE = '.pipeline_state.json'
+LOG_DIR = 'pipeline_logs'
+HASH_BLOCK_SIZE = 1 << 20
+
+Stage = namedtuple('Stage', ['name', 'command', 'inputs', 'outputs'])
+
+BINARY_LINK_FILES = ['wikilinks_bin/page_id_from.npy', 'wikilinks_bin/page_id_to.npy']
+BINARY_TITLE_FILES = ['wikilinks_bin/title_ids.npy', 'wikilinks_bin/title_offsets.npy', 'wikilinks_bin/titles.bin']
+
+STAGES = [
+    Stage('links_binary', ['wikilinks_store.py'],
+          ['wikilinks.csv'],
+          BINARY_LINK_FILES + BINARY_TITLE_FILES),
+    # Always a full recomputation: the stage only reruns for a new link dump, and the edge
+    # snapshot an --incremental run diffs against costs 8 bytes per link to build and keep.
+    # Run PageRank.py --incremental by hand to warm-start from the previous results.
+    Stage('pagerank', ['PageRank.py'],
+          BINARY_LINK_FILES + BINARY_TITLE_FILES + ['wikipedia_people_articles.csv', 'wikilinks_store.py'],
+          ['pagerank_results.csv', 'person_links.npz']),
+    Stage('people', ['MostImportantPeople.py'],
+          BINARY_TITLE_FILES + ['pagerank_results.csv', 'wikipedia_people_articles.csv', 'wikilinks_store.py',
+                                'wikidata_enrichment.py', 'wikidata_cache.py', 'enrichment_journal.py', 'figures_table.py'],
+          ['merged_data.csv', 'top_10000_people_articles_backup.parquet']),
+    Stage('figure_links', ['filterWikilinksByFigure.py', '--input', 'top_10000_people_articles_backup.parquet',
+                           '--output', 'top_10000_people_articles.parquet'],
+          BINARY_LINK_FILES + ['top_10000_people_articles_backup.parquet', 'person_links.npz', 'wikilinks_store.py',
+                               'figures_table.py'],
+          ['top_10000_people_articles.parquet']),
+    Stage('topic_pagerank', ['TopicPageRank.py'],
+          ['top_10000_people_articles.parquet', 'figures_table.py'],
+          ['occupation_ranks.csv']),
+    Stage('sql_format', ['csv_to_sql_format.py', '--input', 'top_10000_people_articles.parquet',
+                         '--output', 'top_10000_people_articles_sql.csv'],
+          ['top_10000_people_articles.parquet', 'figures_table.py'],
+          ['top_10000_people_articles_sql.csv']),
+    Stage('tiles', ['build_tiles.py', '--input', 'top_10000_people_articles.parquet', '--output', 'tiles'],
+          ['top_10000_people_articles.parquet', 'figures_table.py'],
+          ['tiles/meta.json']),
+]
+
+# Only run with --load, since it replaces the tables the live app reads
+LOAD_STAGE = Stage('load', ['load_to_postgres.py', '--input', 'top_10000_people_articles.parquet',
+                            '--occupation-ranks', 'occupation_ranks.csv'],
+                   ['top_10000_people_articles.parquet', 'occupation_ranks.csv', 'csv_to_sql_format.py',
+                    'figures_table.py'],
+                   [])
+
+
+def load_state():
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    return {'files': {}, 'stages': {}}
+
+
+def save_state(state):
+    temp_file = STATE_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(temp_file, STATE_FILE)
+
+
+def file_hash(path, state):
+    # SHA-256 of the file's contents; files whose size and mtime are unchanged since they
+    # were last hashed are not read again (the link dump alone is tens of gigabytes)
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    cached = state['files'].get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    state['files'][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def stage_fingerprint(stage, state):
+    # The stage's command and script count as inputs, so editing either reruns it
+    return {
+        'command': stage.command,
+        'inputs': {path: file_hash(path, state) for path in [stage.command[0]] + stage.inputs},
+    }
+
+
+def is_up_to_date(stage, state):
+    record = state['stages'].get(stage.name)
+    if record is None or record['fingerprint'] != stage_fingerprint(stage, state):
+        return False
+    return all(file_hash(path, state) == digest for path, digest in record['outputs'].items())
+
+
+def peak_memory_mb(rusage):
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    return rusage.ru_maxrss / (1024 * 1024) if sys.platform == 'darwin' else rusage.ru_maxrss / 1024
+
+
+def run_pipeline(stages, jobs=2, force=False, dry_run=False):
+    state = load_state()
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    # A stage depends on every earlier stage that writes one of its inputs
+    producers = {path: stage.name for stage in stages for path in stage.outputs}
+    depends_on = {stage.name: {producers[path] for path in stage.inputs if path in producers} - {stage.name}
+                  for stage in stages}
+
+    status = {}  # name -> 'ran', 'skipped', 'failed' or 'blocked'
+    timings = {}
+    running = {}  # pid -> (stage, process, start time, log file)
+    pending = list(stages)
+
+    while pending or running:
+        for stage in list(pending):
+            if len(running) >= jobs:
+                break
+            upstream = [status.get(name) for name in depends_on[stage.name]]
+            if any(result in ('failed', 'blocked') for result in upstream):
+                status[stage.name] = 'blocked'
+                pending.remove(stage)
+                continue
+            if not all(result in ('ran', 'skipped') for result in upstream):
+                continue
+            pending.remove(stage)
+
+            # Source files that are gone (e.g. the raw dump once converted) do not force a rerun
+            # as long as everything the stage produced is still there
+            missing_sources = [path for path in stage.inputs if path not in producers and not os.path.exists(path)]
+            outputs_present = all(os.path.exists(path) for path in stage.outputs)
+            # (in a dry run, stages after one that would run are assumed to run too)
+            upstream_reruns = dry_run and 'ran' in upstream
+            if not force and not upstream_reruns and (is_up_to_date(stage, state) or (missing_sources and outputs_present)):
+                status[stage.name] = 'skipped'
+                print(f"[{stage.name}] up to date, skipped")
+                continue
+            if dry_run:
+                status[stage.name] = 'ran'
+                print(f"[{stage.name}] would run: python {' '.join(stage.command)}")
+                continue
+
+            log_file = open(os.path.join(LOG_DIR, f'{stage.name}.log'), 'w')
+            process = subprocess.Popen([sys.executable] + stage.command, stdout=log_file, stderr=subprocess.STDOUT)
+            running[process.pid] = (stage, process, time.time(), log_file)
+            print(f"[{stage.name}] started (log in {log_file.name})")
+
+        if not running:
+            continue
+
+        # Reap whichever stage finishes first, with its own resource usage
+        pid, wait_status, rusage = os.wait4(-1, 0)
+        if pid not in running:
+            continue
+        stage, process, start_time, log_file = running.pop(pid)
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+        log_file.close()
+        timings[stage.name] = (time.time() - start_time, peak_memory_mb(rusage))
+
+        if process.returncode == 0:
+            status[stage.name] = 'ran'
+            state['stages'][stage.name] = {
+                'fingerprint': stage_fingerprint(stage, state),
+                'outputs': {path: file_hash(path, state) for path in stage.outputs},
+            }
+            save_state(state)
+            print(f"[{stage.name}] finished in {timings[stage.name][0]:.1f}s")
+        else:
+            status[stage.name] = 'failed'
+            print(f"[{stage.name}] failed with exit code {process.returncode}, see {log_file.name}")
+
+    if dry_run:
+        return True
+    save_state(state)  # Keep the hashes of files that were only checked
+
+    # Per-stage report
+    print(f"\n{'stage':<16}{'status':<10}{'time (s)':>10}{'peak MB':>10}")
+    for stage in stages:
+        seconds, memory = timings.get(stage.name, (None, None))
+        print(f"{stage.name:<16}{status.get(stage.name, '-'):<10}"
+              f"{'' if seconds is None else f'{seconds:.1f}':>10}{'' if memory is None else f'{memory:.0f}':>10}")
+    return all(result in ('ran', 'skipped') for result in status.values())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('stages', nargs='*', help="stages to consider (default: all)")
+    parser.add_argument('--jobs', type=int, default=2, help="stages run at the same time")
+    parser.add_argument('--force', action='store_true', help="rerun stages even if their inputs are unchanged")
+    parser.add_argument('--load', action='store_true', help="finish by loading the results into Postgres")
+    parser.add_argument('--dry-run', action='store_true', help="only show which stages would run")
+    args = parser.parse_args()
+
+    # Stages are declared relative to this directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    stages = STAGES + ([LOAD_STAGE] if args.load else [])
+    if args.stages:
+        unknown = set(args.stages) - {stage.name for stage in stages}
+        if unknown:
+            parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+        stages = [stage for stage in stages if stage.name in args.stages]
+
+    sys.exit(0 if run_pipeline(stages, args.jobs, args.force, args.dry_run) else 1)
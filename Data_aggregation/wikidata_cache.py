@@ -0,0 +1,79 @@
+import json
+import sqlite3
+import time
+from collections import namedtuple
+
+# Durable cache of Wikidata lookups, keyed by (key, language, property): figure entities
+# by article title, labels and coordinates by entity ID. Entries older than the TTL are
+# revalidated against the entity's current revision before they are fetched again.
+CACHE_FILE = 'wikidata_cache.sqlite'
+DEFAULT_TTL = 30 * 24 * 3600  # Seconds before an entry is revalidated
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'entity_id', 'revision', 'fetched_at'])
+
+
+class WikidataCache:
+    def __init__(self, path=CACHE_FILE, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT NOT NULL,
+                language TEXT NOT NULL,
+                property TEXT NOT NULL,
+                value TEXT,
+                entity_id TEXT,
+                revision INTEGER,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (key, language, property)
+            )
+        """)
+        self.conn.commit()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, keys, language, prop):
+        entries = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):  # Stay below SQLite's bound parameter limit
+            batch = keys[start:start + 500]
+            placeholders = ', '.join(['?'] * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, value, entity_id, revision, fetched_at FROM entries "
+                f"WHERE language = ? AND property = ? AND key IN ({placeholders})",
+                [language, prop, *batch]
+            )
+            for key, value, entity_id, revision, fetched_at in rows:
+                entries[key] = CacheEntry(json.loads(value), entity_id, revision, fetched_at)
+        return entries
+
+    def is_fresh(self, entry, now=None):
+        return (now or time.time()) - entry.fetched_at < self.ttl
+
+    def put_many(self, language, prop, entries):
+        # entries: {key: (value, entity_id, revision)}
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO entries (key, language, property, value, entity_id, revision, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(key, language, prop, json.dumps(value), entity_id, revision, now)
+             for key, (value, entity_id, revision) in entries.items()]
+        )
+        self.conn.commit()
+
+    def touch_many(self, keys, language, prop):
+        # Mark revalidated entries as fresh again
+        now = time.time()
+        self.conn.executemany(
+            "UPDATE entries SET fetched_at = ? WHERE key = ? AND language = ? AND property = ?",
+            [(now, key, language, prop) for key in keys]
+        )
+        self.conn.commit()
+
+    def hit_rate(self):
+        total = self.hits + self.revalidated + self.misses
+        return (self.hits + self.revalidated) / total if total else 0.0
@@ -0,0 +1,350 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Wikidata API endpoint (point it at wikidata_stub_server.py for offline runs)
+WIKIDATA_API_URL = os.environ.get('WIKIDATA_API_URL', 'https://www.wikidata.org/w/api.php')
+USER_AGENT = 'History_is_written_by_the_wiki-ers/1.0 (https://github.com/idansagel/History_is_written_by_the_wiki-ers)'
+
+# wbgetentities accepts up to 50 titles or IDs per call
+MAX_IDS_PER_REQUEST = 50
+
+# List of properties to check for a location, in order of preference
+# P119: Place of burial, P20: Place of death, P19: Place of birth, P551: Residence,
+# P27: Country of citizenship, P937: Work location, P69: Educated at
+LOCATION_PROPERTIES = ['P119', 'P20', 'P19', 'P551', 'P27', 'P937', 'P69']
+
+
+def parse_year(date_string):
+    if not date_string:
+        return None
+
+    match = re.match(r'([+-])(\d+)-(\d{2})-(\d{2})', date_string)
+    if match:
+        sign, year, month, day = match.groups()
+        year = int(year)
+        return -year if sign == '-' else year
+    return None
+
+
+def format_year(year):
+    if year is None:
+        return None
+    if year < 0:
+        return f"-{abs(year):04d}"  # BC year
+    else:
+        return f"{year:04d}"  # AD year without +
+
+
+def normalize_title(title):
+    # Wikipedia titles use spaces and an upper-case first letter; dumps often use underscores
+    title = str(title).replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+
+def claim_ids(claims, property_id):
+    ids = []
+    for claim in claims.get(property_id, []):
+        try:
+            ids.append(claim['mainsnak']['datavalue']['value']['id'])
+        except (KeyError, TypeError):
+            continue
+    return ids
+
+
+def claim_coordinates(claims):
+    try:
+        location = claims['P625'][0]['mainsnak']['datavalue']['value']
+        return location['latitude'], location['longitude']
+    except (KeyError, IndexError, TypeError):
+        return None, None
+
+
+def title_renames(response):
+    # {from: to} of the titles the API normalized or followed a redirect for. The arrays use
+    # the action=query layout (a list of {from, to}), or a dict of such entries
+    renames = {}
+    for key in ('normalized', 'redirects'):
+        entries = response.get(key) or []
+        for entry in (entries.values() if isinstance(entries, dict) else entries):
+            if isinstance(entry, dict) and 'from' in entry and 'to' in entry:
+                renames[normalize_title(entry['from'])] = normalize_title(entry['to'])
+    return renames
+
+
+def match_titles(titles, response):
+    # Entities of a wbgetentities response by requested title, and the requested titles that
+    # could not be matched to an entity or to a "missing" entry
+    renames = title_renames(response)
+    found, missing = {}, set()
+    for entity in response.get('entities', {}).values():
+        if 'missing' in entity:
+            if entity.get('title'):
+                missing.add(normalize_title(entity['title']))
+            continue
+        title = entity.get('sitelinks', {}).get('enwiki', {}).get('title')
+        if title:
+            found[normalize_title(title)] = entity
+
+    matched, unmatched = {}, []
+    for title in titles:
+        current = title
+        for _ in range(len(renames) + 1):  # Follow normalization, then redirects, without looping
+            if current in found or current in missing or current not in renames:
+                break
+            current = renames[current]
+        if current in found:
+            matched[title] = found[current]
+        elif current not in missing and title not in missing:
+            unmatched.append(title)
+    return matched, unmatched
+
+
+class TokenBucket:
+    # Thread-safe rate limiter: `rate` requests per second, with bursts of up to `capacity`
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class WikidataEnricher:
+    def __init__(self, api_url=WIKIDATA_API_URL, max_workers=4, requests_per_second=10,
+                 batch_size=MAX_IDS_PER_REQUEST, max_retries=3, cache=None):
+        self.api_url = api_url
+        self.cache = cache  # Optional WikidataCache shared by all lookups
+        self.max_workers = max_workers
+        self.batch_size = min(batch_size, MAX_IDS_PER_REQUEST)
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.local = threading.local()
+        self.request_count = 0
+        self.count_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def session(self):
+        # One keep-alive session per worker thread, reused for every batch it fetches
+        if not hasattr(self.local, 'session'):
+            session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self.local.session = session
+        return self.local.session
+
+    def get(self, params):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            with self.count_lock:
+                self.request_count += 1
+            try:
+                response = self.session().get(self.api_url, params={**params, 'format': 'json'}, timeout=60)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                response.raise_for_status()
+                return response.json()
+            except (requests.RequestException, ValueError) as error:
+                if attempt == self.max_retries:
+                    raise
+                # Back off exponentially, or as long as the server asks to
+                retry_after = getattr(getattr(error, 'response', None), 'headers', {}).get('Retry-After')
+                time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt)
+
+    def fetch_in_batches(self, values, params):
+        # Split the values into wbgetentities batches and fetch them concurrently
+        values = list(dict.fromkeys(values))
+        key = 'titles' if 'sites' in params else 'ids'
+        batches = [values[i:i + self.batch_size] for i in range(0, len(values), self.batch_size)]
+
+        def fetch(batch):
+            return self.get({**params, 'action': 'wbgetentities', key: '|'.join(batch)}).get('entities', {})
+
+        entities = {}
+        for batch_entities in self.pool.map(fetch, batches):
+            entities.update(batch_entities)
+        return entities
+
+    def fetch_entities(self, titles):
+        # Parsed entities of English Wikipedia articles, keyed by normalized title
+        params = {
+            'sites': 'enwiki',
+            'props': 'info|claims|descriptions|sitelinks',
+            'sitefilter': 'enwiki',
+            'languages': 'en'
+        }
+        titles = list(dict.fromkeys(titles))
+        batches = [titles[i:i + self.batch_size] for i in range(0, len(titles), self.batch_size)]
+
+        def fetch(batch):
+            response = self.get({**params, 'action': 'wbgetentities', 'titles': '|'.join(batch)})
+            return match_titles(batch, response)
+
+        by_title, unmatched = {}, []
+        for matched, batch_unmatched in self.pool.map(fetch, batches):
+            by_title.update(matched)
+            unmatched += batch_unmatched
+
+        # Entities of renamed or redirected titles come back under their current title, and
+        # a batch response does not always say which request they answer; asked one at a
+        # time, the only entity returned is the one for that title
+        def fetch_single(title):
+            response = self.get({**params, 'action': 'wbgetentities', 'titles': title, 'normalize': 1})
+            found = [entity for entity in response.get('entities', {}).values() if 'missing' not in entity]
+            return title, found[0] if len(found) == 1 else None
+
+        for title, entity in self.pool.map(fetch_single, unmatched):
+            if entity is not None:
+                by_title[title] = entity
+
+        return {title: (self.parse_entity(by_title.get(title)), by_title.get(title, {}).get('id'),
+                        by_title.get(title, {}).get('lastrevid'))
+                for title in titles}
+
+    def fetch_labels(self, entity_ids, language='en'):
+        entities = self.fetch_in_batches(entity_ids, {'props': 'info|labels', 'languages': language})
+        results = {}
+        for entity_id in entity_ids:
+            entity = entities.get(entity_id, {})
+            label = entity.get('labels', {}).get(language, {}).get('value')
+            results[entity_id] = (label, entity_id, entity.get('lastrevid'))
+        return results
+
+    def fetch_coordinates(self, place_ids):
+        entities = self.fetch_in_batches(place_ids, {'props': 'info|claims'})
+        results = {}
+        for place_id in place_ids:
+            entity = entities.get(place_id, {})
+            results[place_id] = (claim_coordinates(entity.get('claims', {})), place_id, entity.get('lastrevid'))
+        return results
+
+    def fetch_revisions(self, entity_ids):
+        entities = self.fetch_in_batches(entity_ids, {'props': 'info'})
+        return {entity_id: entity.get('lastrevid') for entity_id, entity in entities.items()}
+
+    def cached_lookup(self, keys, language, prop, fetch):
+        # fetch(keys) returns {key: (value, entity_id, revision)}
+        if self.cache is None:
+            return {key: value for key, (value, _, _) in fetch(keys).items()} if keys else {}
+
+        cached = self.cache.get_many(keys, language, prop)
+        results = {key: entry.value for key, entry in cached.items() if self.cache.is_fresh(entry)}
+        self.cache.hits += len(results)
+
+        # Expired entries are kept when their entity has not been edited since they were fetched
+        stale = [key for key, entry in cached.items() if key not in results and entry.entity_id]
+        if stale:
+            revisions = self.fetch_revisions(sorted({cached[key].entity_id for key in stale}))
+            unchanged = [key for key in stale
+                         if cached[key].revision is not None and revisions.get(cached[key].entity_id) == cached[key].revision]
+            self.cache.touch_many(unchanged, language, prop)
+            self.cache.revalidated += len(unchanged)
+            results.update({key: cached[key].value for key in unchanged})
+
+        missing = [key for key in keys if key not in results]
+        if missing:
+            fetched = fetch(missing)
+            self.cache.put_many(language, prop, fetched)
+            self.cache.misses += len(missing)
+            results.update({key: value for key, (value, _, _) in fetched.items()})
+        return results
+
+    def enrich(self, titles):
+        # Fetch every figure's entity, then resolve all their labels and places in shared batches
+        keys = [normalize_title(title) for title in titles]
+        entities = self.cached_lookup(list(dict.fromkeys(keys)), 'en', 'entity', self.fetch_entities)
+        parsed = [entities[key] for key in keys]
+
+        label_ids = sorted({entity_id for row in parsed for entity_id in row['occupation_ids'] + row['field_ids']})
+        place_ids = sorted({place_id for row in parsed for place_id in row['place_ids']})
+        labels = self.cached_lookup(label_ids, 'en', 'label', self.fetch_labels)
+        coordinates = self.cached_lookup(place_ids, '', 'P625', self.fetch_coordinates)
+
+        results = []
+        for row in parsed:
+            # First candidate place that has coordinates, else the entity's own coordinates
+            lat, lon = next((coordinates[place_id] for place_id in row['place_ids']
+                             if coordinates[place_id][0] is not None), row['coordinates'])
+            results.append({
+                'birth': row['birth'],
+                'death': row['death'],
+                'image_url': row['image_url'],
+                'description': row['description'],
+                'occupation': [labels.get(entity_id) for entity_id in row['occupation_ids']],
+                'field': [labels.get(entity_id) for entity_id in row['field_ids']],
+                'latitude': lat,
+                'longitude': lon
+            })
+        return results
+
+    def parse_entity(self, entity):
+        row = {'birth': None, 'death': None, 'image_url': None, 'description': None, 'occupation_ids': [],
+               'field_ids': [], 'place_ids': [], 'coordinates': (None, None)}
+        if entity is None:
+            return row
+
+        # Description
+        row['description'] = entity.get('descriptions', {}).get('en', {}).get('value')
+
+        # Claims (facts)
+        claims = entity.get('claims', {})
+
+        # Birth and death
+        def get_date(property_id, earliest=True):
+            years = []
+            for claim in claims.get(property_id, []):
+                date_value = claim.get('mainsnak', {}).get('datavalue', {}).get('value', {}).get('time')
+                year = parse_year(date_value)
+                if year is not None:
+                    years.append(year)
+            if years:
+                return format_year(min(years) if earliest else max(years))
+            return None
+
+        row['birth'] = get_date('P569', earliest=True)  # Choose earliest birth year
+        row['death'] = get_date('P570', earliest=False)  # Choose latest death year
+
+        # Image URL
+        if 'P18' in claims:
+            try:
+                row['image_url'] = f"https://commons.wikimedia.org/wiki/Special:FilePath/{claims['P18'][0]['mainsnak']['datavalue']['value']}"
+            except (KeyError, IndexError):
+                row['image_url'] = None
+
+        # Occupation(s) and field(s) of work, resolved to names later
+        row['occupation_ids'] = claim_ids(claims, 'P106')
+        row['field_ids'] = claim_ids(claims, 'P101')
+
+        # Candidate places (first claim of each location property) and direct geolocation
+        row['place_ids'] = list(dict.fromkeys(
+            ids[0] for ids in (claim_ids(claims, pid) for pid in LOCATION_PROPERTIES) if ids
+        ))
+        row['coordinates'] = claim_coordinates(claims)
+        return row
@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for the wbgetentities endpoint of the Wikidata API, for offline runs and
+# benchmarks of the enrichment step. Every title and ID maps to a deterministic fake entity.
+# Like on the real site, titles are normalized (underscores, lower-case first letter), a
+# title ending in REDIRECT_SUFFIX is a redirect to the title without it, and titles starting
+# with MISSING_PREFIX have no entity.
+OCCUPATION_IDS = [f'Q{100 + i}' for i in range(40)]
+PLACE_IDS = [f'Q{1000 + i}' for i in range(400)]
+REDIRECT_SUFFIX = ' (redirect)'
+MISSING_PREFIX = 'Missing '
+
+
+def stable_int(value):
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def item_claim(entity_id):
+    return {'mainsnak': {'datavalue': {'value': {'id': entity_id}}}}
+
+
+def time_claim(year):
+    return {'mainsnak': {'datavalue': {'value': {'time': f"{'-' if year < 0 else '+'}{abs(year):04d}-01-01T00:00:00Z"}}}}
+
+
+def coordinate_claim(lat, lon):
+    return {'mainsnak': {'datavalue': {'value': {'latitude': lat, 'longitude': lon}}}}
+
+
+def normalize_title(title):
+    title = title.replace('_', ' ')
+    return title[:1].upper() + title[1:]
+
+
+def resolve_title(title):
+    # The article a requested title leads to
+    title = normalize_title(title)
+    return title[:-len(REDIRECT_SUFFIX)] if title.endswith(REDIRECT_SUFFIX) else title
+
+
+def person_entity(title):
+    # A figure with dates, occupations, a field, a birthplace and a country
+    h = stable_int(title)
+    birth = -500 + h % 2400
+    claims = {
+        'P569': [time_claim(birth)],
+        'P106': [item_claim(OCCUPATION_IDS[(h >> k) % len(OCCUPATION_IDS)]) for k in (0, 7)],
+        'P101': [item_claim(OCCUPATION_IDS[(h >> 3) % len(OCCUPATION_IDS)])],
+        'P19': [item_claim(PLACE_IDS[h % len(PLACE_IDS)])],
+        'P27': [item_claim(PLACE_IDS[(h >> 5) % len(PLACE_IDS)])],
+    }
+    if birth < 1950:
+        claims['P570'] = [time_claim(birth + 20 + h % 70)]
+    entity_id = f'Q{10 ** 6 + h % 10 ** 8}'
+    return entity_id, {
+        'type': 'item',
+        'id': entity_id,
+        'lastrevid': 1000 + stable_int(entity_id) % 1000,  # Same revision as when fetched by ID
+        'descriptions': {'en': {'language': 'en', 'value': f'Description of {title}'}},
+        'sitelinks': {'enwiki': {'site': 'enwiki', 'title': title}},
+        'claims': claims,
+    }
+
+
+def item_entity(entity_id):
+    # Occupations and fields get a label, places get coordinates (a tenth of them have none)
+    h = stable_int(entity_id)
+    claims = {}
+    if entity_id in PLACE_IDS and h % 10:
+        claims['P625'] = [coordinate_claim(-60 + h % 130 + 0.5, -180 + (h >> 8) % 360 + 0.5)]
+    return {
+        'type': 'item',
+        'id': entity_id,
+        'lastrevid': 1000 + h % 1000,
+        'labels': {'en': {'language': 'en', 'value': f'label {entity_id}'}},
+        'claims': claims,
+    }
+
+
+class WikidataStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        entities = {}
+        result = {'success': 1}
+        if params.get('action') == 'wbgetentities' and 'titles' in params:
+            titles = params['titles'].split('|')
+            for title in titles:
+                article = resolve_title(title)
+                if article.startswith(MISSING_PREFIX):
+                    entities[str(-1 - len(entities))] = {'site': 'enwiki', 'title': article, 'missing': ''}
+                else:
+                    entity_id, entity = person_entity(article)
+                    entities[entity_id] = entity
+            # The real API only reports normalization for a single title, with normalize=1
+            if params.get('normalize') and len(titles) == 1 and normalize_title(titles[0]) != titles[0]:
+                result['normalized'] = {'n': {'from': titles[0], 'to': normalize_title(titles[0])}}
+        elif params.get('action') == 'wbgetentities' and 'ids' in params:
+            for entity_id in params['ids'].split('|'):
+                entities[entity_id] = item_entity(entity_id)
+
+        body = json.dumps({'entities': entities, **result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, latency=0.0):
+    # Serve in a background thread; returns the server and its api.php URL
+    server = ThreadingHTTPServer(('127.0.0.1', port), WikidataStubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/w/api.php'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.port, args.latency)
+    print(f"Wikidata stub serving at {url} (set WIKIDATA_API_URL to use it)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
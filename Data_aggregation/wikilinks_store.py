@@ -0,0 +1,207 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# Binary copy of the wikilinks dump: the link endpoints as memory-mappable int32 .npy
+# arrays, plus a page_id -> title dictionary stored as sorted IDs, offsets and a UTF-8 blob
+wikilinks_file = 'wikilinks.csv'
+binary_dir = 'wikilinks_bin'
+chunk_size = 1000000
+
+LINK_FILES = ('page_id_from.npy', 'page_id_to.npy')
+TITLE_FILES = ('title_ids.npy', 'title_offsets.npy', 'titles.bin')
+NPY_HEADER_SIZE = 128  # Bytes reserved for the .npy header, written once the length is known
+
+def write_npy_header(f, dtype, length):
+    f.seek(0)
+    np.lib.format.write_array_header_1_0(f, {
+        'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        'fortran_order': False,
+        'shape': (length,)
+    })
+    if f.tell() != NPY_HEADER_SIZE:
+        raise ValueError(f"Unexpected .npy header size {f.tell()}")
+
+def is_up_to_date(csv_file=wikilinks_file, directory=binary_dir):
+    paths = [os.path.join(directory, name) for name in LINK_FILES + TITLE_FILES]
+    if not all(os.path.exists(path) for path in paths):
+        return False
+    return not os.path.exists(csv_file) or min(os.path.getmtime(path) for path in paths) >= os.path.getmtime(csv_file)
+
+def convert(csv_file=wikilinks_file, directory=binary_dir):
+    # Write into a directory next to the target and swap it in once every file is complete,
+    # so an interrupted conversion never leaves partial files that look up to date
+    target, directory = directory, directory.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    link_paths = [os.path.join(directory, name) for name in LINK_FILES]
+    titles = []
+    total = 0
+
+    # Stream the dump once, appending the IDs after a placeholder header
+    with open(link_paths[0], 'wb') as from_file, open(link_paths[1], 'wb') as to_file:
+        for f in (from_file, to_file):
+            f.write(b'\0' * NPY_HEADER_SIZE)
+        for chunk in tqdm(pd.read_csv(csv_file, sep='\t', chunksize=chunk_size,
+                                      dtype={'page_id_from': np.int32, 'page_id_to': np.int32}),
+                          desc="Converting wikilinks"):
+            from_file.write(chunk['page_id_from'].to_numpy().tobytes())
+            to_file.write(chunk['page_id_to'].to_numpy().tobytes())
+            total += len(chunk)
+
+            # Collect the distinct (page_id, title) pairs of both link ends
+            for side in ('from', 'to'):
+                pairs = chunk[[f'page_id_{side}', f'page_title_{side}']].drop_duplicates(f'page_id_{side}')
+                pairs.columns = ['page_id', 'title']
+                titles.append(pairs)
+            if len(titles) >= 32:
+                titles = [pd.concat(titles).drop_duplicates('page_id')]
+
+        for f in (from_file, to_file):
+            write_npy_header(f, np.int32, total)
+
+    # Title dictionary sorted by page ID, so single titles can be found by binary search
+    titles = pd.concat(titles).drop_duplicates('page_id').sort_values('page_id')
+    encoded = [str(title).encode('utf-8') for title in titles['title']]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(title) for title in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, 'title_ids.npy'), titles['page_id'].to_numpy(dtype=np.int32))
+    np.save(os.path.join(directory, 'title_offsets.npy'), offsets)
+    with open(os.path.join(directory, 'titles.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(directory, target)
+    print(f"Converted {total} links and {len(encoded)} titles into {target}/")
+
+def ensure_binary(csv_file=wikilinks_file, directory=binary_dir):
+    # Convert the CSV dump the first time it is needed, or again after it was replaced
+    if not is_up_to_date(csv_file, directory):
+        convert(csv_file, directory)
+
+def load_links(csv_file=wikilinks_file, directory=binary_dir):
+    ensure_binary(csv_file, directory)
+    return tuple(np.load(os.path.join(directory, name), mmap_mode='r') for name in LINK_FILES)
+
+def iter_link_chunks(from_ids, to_ids, size=chunk_size):
+    for start in range(0, len(from_ids), size):
+        yield np.asarray(from_ids[start:start + size]), np.asarray(to_ids[start:start + size])
+
+def scan_links(stages, csv_file=wikilinks_file, directory=binary_dir, size=chunk_size):
+    # Read the link arrays once and hand every chunk to each stage in turn
+    from_ids, to_ids = load_links(csv_file, directory)
+    for stage in stages:
+        stage.start(len(from_ids))
+    for from_chunk, to_chunk in tqdm(iter_link_chunks(from_ids, to_ids, size),
+                                     total=-(-len(from_ids) // size), desc="Scanning wikilinks"):
+        for stage in stages:
+            stage.consume(from_chunk, to_chunk)
+    return [stage.finish() for stage in stages]
+
+class EdgeCollector:
+    # Copies every link into preallocated int32 arrays (the input of PageRank)
+    def start(self, total):
+        self.from_ids = np.empty(total, dtype=np.int32)
+        self.to_ids = np.empty(total, dtype=np.int32)
+        self.position = 0
+
+    def consume(self, from_chunk, to_chunk):
+        end = self.position + len(from_chunk)
+        self.from_ids[self.position:end] = from_chunk
+        self.to_ids[self.position:end] = to_chunk
+        self.position = end
+
+    def finish(self):
+        return self.from_ids, self.to_ids
+
+class LinkFilter:
+    # Keeps the links whose both ends are in page_ids, as sorted and de-duplicated int arrays
+    def __init__(self, page_ids):
+        self.page_ids = np.unique(np.asarray(page_ids, dtype=np.int32))
+
+    def start(self, total):
+        self.from_parts, self.to_parts = [], []
+
+    def consume(self, from_chunk, to_chunk):
+        mask = np.isin(from_chunk, self.page_ids) & np.isin(to_chunk, self.page_ids)
+        self.from_parts.append(from_chunk[mask])
+        self.to_parts.append(to_chunk[mask])
+
+    def finish(self):
+        return sort_links(np.concatenate(self.from_parts), np.concatenate(self.to_parts))
+
+def sort_links(from_ids, to_ids):
+    # Sort links by (from, to) and drop duplicates
+    keys = np.unique((from_ids.astype(np.int64) << 32) | to_ids)
+    return (keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32)
+
+def filter_links(from_ids, to_ids, page_ids):
+    # Keep the (already sorted) links whose both ends are in page_ids
+    mask = np.isin(from_ids, page_ids) & np.isin(to_ids, page_ids)
+    return from_ids[mask], to_ids[mask]
+
+def group_links(from_ids, to_ids):
+    # CSR view of sorted links: the distinct sources and the offset of each one's targets
+    sources, offsets = np.unique(from_ids, return_index=True)
+    return sources, np.append(offsets, len(from_ids)), to_ids
+
+def is_newer_than_links(path, directory=binary_dir):
+    # Whether a file derived from the link arrays was written after their last conversion
+    links_path = os.path.join(directory, LINK_FILES[0])
+    return os.path.exists(path) and os.path.exists(links_path) and os.path.getmtime(path) >= os.path.getmtime(links_path)
+
+def save_filtered_links(path, from_ids, to_ids):
+    np.savez(path, page_id_from=from_ids, page_id_to=to_ids)
+
+def load_filtered_links(path):
+    with np.load(path) as links:
+        return links['page_id_from'], links['page_id_to']
+
+class TitleIndex:
+    def __init__(self, csv_file=wikilinks_file, directory=binary_dir):
+        ensure_binary(csv_file, directory)
+        self.ids = np.load(os.path.join(directory, 'title_ids.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(directory, 'title_offsets.npy'), mmap_mode='r')
+        self.blob = np.memmap(os.path.join(directory, 'titles.bin'), dtype=np.uint8, mode='r')
+
+    def lookup(self, page_ids):
+        # Binary search each ID and decode only the titles that are asked for
+        page_ids = np.asarray(page_ids)
+        positions = np.searchsorted(self.ids, page_ids)
+        titles = []
+        for page_id, position in zip(page_ids.tolist(), positions.tolist()):
+            if position < len(self.ids) and self.ids[position] == page_id:
+                start, end = self.offsets[position], self.offsets[position + 1]
+                titles.append(self.blob[start:end].tobytes().decode('utf-8'))
+            else:
+                titles.append(None)
+        return titles
+
+    def all_titles(self):
+        # Every title in ID order, decoded in one pass: the blob is copied with a newline after
+        # each title (titles never contain one), decoded once and split
+        count = len(self.ids)
+        if count == 0:
+            return []
+        separators = np.zeros(len(self.blob) + count, dtype=bool)
+        separators[np.asarray(self.offsets[1:]) + np.arange(count)] = True
+        joined = np.full(len(separators), ord('\n'), dtype=np.uint8)
+        joined[~separators] = self.blob
+        del separators
+        titles = joined[:-1].tobytes().decode('utf-8').split('\n')
+        if len(titles) != count:
+            raise ValueError("A title in the dictionary contains a newline")
+        return titles
+
+    def find_ids(self, titles):
+        # Reverse lookup: page IDs of the given titles (scans the whole dictionary)
+        frame = self.to_frame()
+        return frame.loc[frame['title'].isin(set(titles)), 'page_id'].to_numpy()
+
+    def to_frame(self):
+        return pd.DataFrame({'page_id': np.asarray(self.ids), 'title': self.all_titles()})
+
+if __name__ == '__main__':
+    convert()
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import igraph as ig
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from communities import CLUSTER_BACKENDS, detect_communities, edges_to_csr
+
+# Compare runtime and modularity of the community detection backends on the figure link graph
+parser = argparse.ArgumentParser()
+parser.add_argument('--edges', default=os.path.join(os.path.dirname(__file__), '..', 'Data_aggregation', 'figures_wikilinks.csv'))
+parser.add_argument('--repeats', type=int, default=3)
+parser.add_argument('--seed', type=int, default=42)
+args = parser.parse_args()
+
+# Load the edges and map page IDs to row numbers
+edges = pd.read_csv(args.edges)
+node_ids = np.unique(np.concatenate([edges['page_id_from'].to_numpy(), edges['page_id_to'].to_numpy()]))
+n = len(node_ids)
+edge_keys = np.unique(np.searchsorted(node_ids, edges['page_id_from'].to_numpy()) * n
+                      + np.searchsorted(node_ids, edges['page_id_to'].to_numpy()))
+indptr, indices = edges_to_csr(edge_keys // n, edge_keys % n, n)
+print(f"Graph: {n} nodes, {len(indices)} directed links")
+
+# Undirected, simplified graph used to score every partition the same way
+scoring_graph = ig.Graph(n=n, edges=np.column_stack((edge_keys // n, edge_keys % n)), directed=False)
+scoring_graph.simplify(multiple=True, loops=False)
+row_of = {page_id: i for i, page_id in enumerate(node_ids.tolist())}
+
+print(f"{'backend':<16}{'best (s)':>10}{'mean (s)':>10}{'clusters':>10}{'modularity':>12}")
+for backend in CLUSTER_BACKENDS:
+    timings = []
+    for repeat in range(args.repeats):
+        start_time = time.perf_counter()
+        clusters = detect_communities(node_ids, indptr, indices, backend=backend, seed=args.seed + repeat)
+        timings.append(time.perf_counter() - start_time)
+
+    membership = [clusters[page_id] for page_id in sorted(clusters, key=row_of.get)]
+    modularity = scoring_graph.modularity(membership)
+    print(f"{backend:<16}{min(timings):>10.3f}{np.mean(timings):>10.3f}{len(set(membership)):>10}{modularity:>12.4f}")
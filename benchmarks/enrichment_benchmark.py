@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Data_aggregation'))
+from wikidata_enrichment import WikidataEnricher
+from wikidata_stub_server import REDIRECT_SUFFIX, start_stub_server
+
+# Compare one-request-per-lookup enrichment with the batched, concurrent engine,
+# against the local Wikidata stub with a simulated network round trip
+parser = argparse.ArgumentParser()
+parser.add_argument('--figures', type=int, default=300)
+parser.add_argument('--latency', type=float, default=0.05, help="simulated round trip in seconds")
+parser.add_argument('--workers', type=int, default=4)
+args = parser.parse_args()
+
+server, url = start_stub_server(latency=args.latency)
+titles = [f'Figure_{i}' for i in range(args.figures)]
+
+configurations = [
+    ('sequential, 1 per call', dict(max_workers=1, batch_size=1)),
+    ('sequential, 50 per call', dict(max_workers=1, batch_size=50)),
+    (f'{args.workers} workers, 50 per call', dict(max_workers=args.workers, batch_size=50)),
+]
+
+print(f"{args.figures} figures, {args.latency * 1000:.0f} ms simulated latency")
+print(f"{'configuration':<26}{'time (s)':>10}{'requests':>10}{'figures/s':>11}")
+reference = None
+for name, options in configurations:
+    with WikidataEnricher(api_url=url, requests_per_second=1000, **options) as enricher:
+        start_time = time.perf_counter()
+        results = enricher.enrich(titles)
+        elapsed = time.perf_counter() - start_time
+    if reference is None:
+        reference = results
+    elif results != reference:
+        print(f"{name}: results differ from the sequential run")
+    print(f"{name:<26}{elapsed:>10.2f}{enricher.request_count:>10}{args.figures / elapsed:>11.1f}")
+
+# Figures requested by a redirect or a non-normalized title get their article's data
+with WikidataEnricher(api_url=url, requests_per_second=1000) as enricher:
+    aliases = [titles[0] + REDIRECT_SUFFIX, titles[1].lower()]
+    if enricher.enrich(aliases) != reference[:2]:
+        print("Redirected or renamed titles did not get their article's data")
+
+server.shutdown()
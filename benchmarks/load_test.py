@@ -0,0 +1,384 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import requests
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO_DIR, 'Data_aggregation'))
+from figures_table import write_figures
+from csv_to_sql_format import prepare_sql_frame
+from load_to_postgres import (load_tables, TOP_FIGURES_COLUMNS, TOP_FIGURES_INDEXES,
+                              OCCUPATION_RANKS_COLUMNS, OCCUPATION_RANKS_INDEXES)
+
+# Multi-user load test of the Dash app: simulated users replay sessions of slider drags,
+# dot clicks and opened modals against the app served by gunicorn, through Dash's callback
+# endpoint, and the latency of every callback is reported. By default the app runs against
+# an embedded Postgres (pgserver) seeded with synthetic figures, in a scratch directory.
+OCCUPATIONS = ['politician', 'writer', 'painter', 'composer', 'philosopher', 'military officer', 'poet',
+               'physicist', 'mathematician', 'actor', 'singer', 'monarch', 'theologian', 'architect',
+               'explorer', 'chemist', 'historian', 'economist', 'sculptor', 'film director']
+
+# Callbacks exercised by the sessions, found in /_dash-dependencies by one of their outputs
+SESSION_CALLBACKS = {
+    'update_map': 'world-map.figure',
+    'update_click_data': 'related-request.data',
+    'find_related_figures': 'filtered-links.children',
+    'toggle_modal': 'list-container.children',
+}
+
+
+# Synthetic figures with the shape of the real data: a few very important figures and a long
+# tail, most of them born in the last few centuries, and links pointing mostly at the
+# important ones (so neighborhoods and clusters look like the real graph's)
+def synthetic_figures(n, seed):
+    rng = np.random.default_rng(seed)
+    page_ids = rng.choice(50_000_000, size=n, replace=False) + 1
+    scores = np.sort(rng.pareto(1.5, n) + 1)[::-1] / n
+
+    births = np.clip(2000 - rng.exponential(350, n), -3000, 2005).astype(int)
+    deaths = (births + rng.integers(25, 95, n)).astype(float)
+    deaths[deaths > 2024] = np.nan
+
+    link_counts = rng.poisson(12, n)
+    link_rows = (rng.power(0.35, int(link_counts.sum())) * n).astype(int)
+    link_offsets = np.concatenate([[0], np.cumsum(link_counts)])
+
+    occupation_ids = rng.zipf(1.6, (n, 2)) % len(OCCUPATIONS)
+    return pd.DataFrame({
+        'page_id': page_ids,
+        'article_name': [f'Figure {i}' for i in range(n)],
+        'pagerank_score': scores,
+        'wikipedia link': [f'https://en.wikipedia.org/wiki/Figure_{i}' for i in range(n)],
+        'birth': births,
+        'death': deaths,
+        'image_url': None,
+        'description': [f'Synthetic figure number {i}' for i in range(n)],
+        'occupation': [sorted({OCCUPATIONS[a], OCCUPATIONS[b]}) for a, b in occupation_ids],
+        'field': [[] for _ in range(n)],
+        'latitude': rng.uniform(-45, 65, n),
+        'longitude': rng.uniform(-125, 145, n),
+        'outgoing_link_ids': [page_ids[link_rows[link_offsets[i]:link_offsets[i + 1]]] for i in range(n)],
+    })
+
+
+def synthetic_occupation_ranks(df, seed):
+    # Per-occupation ranking in the layout written by TopicPageRank.py
+    rng = np.random.default_rng(seed)
+    ranks = df[['page_id', 'occupation', 'pagerank_score']].explode('occupation').dropna()
+    ranks['topic_pagerank_score'] = ranks['pagerank_score'] * rng.uniform(0.5, 1.5, len(ranks))
+    position = ranks.groupby('occupation')['topic_pagerank_score'].rank(ascending=False, method='first')
+    size = ranks.groupby('occupation')['page_id'].transform('count')
+    ranks['color_value'] = np.where(size > 1, 1.0 - (position - 1) / (size - 1).clip(lower=1), 1.0)
+    return ranks[['page_id', 'occupation', 'topic_pagerank_score', 'color_value']]
+
+
+def seed_database(database_url, work_dir, figures, seed):
+    # The app reads the figure graph from src/ (relative to where it runs) and the rest
+    # from Postgres; both get the same synthetic figures, loaded as by the pipeline
+    data_file = os.path.join(work_dir, 'src', 'top_10000_people_articles.parquet')
+    os.makedirs(os.path.dirname(data_file), exist_ok=True)
+    df = synthetic_figures(figures, seed)
+    write_figures(df, data_file)
+
+    conn = psycopg2.connect(database_url)
+    sql_df = prepare_sql_frame(data_file).rename(columns={'wikipedia link': 'wikipedia_link'})
+    load_tables(conn, [
+        ('top_figures', TOP_FIGURES_COLUMNS, TOP_FIGURES_INDEXES, sql_df),
+        ('occupation_ranks', OCCUPATION_RANKS_COLUMNS, OCCUPATION_RANKS_INDEXES, synthetic_occupation_ranks(df, seed)),
+    ])
+    conn.close()
+
+
+def start_embedded_database(work_dir):
+    # pgserver ships its own Postgres binaries; it is only needed for this benchmark
+    try:
+        import pgserver
+    except ImportError:
+        sys.exit("The embedded database needs pgserver (pip install pgserver), or pass --database-url")
+    server = pgserver.get_server(os.path.join(work_dir, 'pgdata'), cleanup_mode='stop')
+    return server, server.get_uri()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(work_dir, database_url, workers, threads, startup_timeout):
+    # gunicorn as in render.yaml, from the scratch directory so the app finds the synthetic
+    # data files (and writes its cluster file and shared cache) there
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url,
+               SHARED_CACHE_PATH=os.path.join(work_dir, 'shared_cache.sqlite'))
+    env.pop('RENDER', None)
+    log_file = open(os.path.join(work_dir, 'gunicorn.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--pythonpath', os.path.join(REPO_DIR, 'src'),
+         '--workers', str(workers), '--threads', str(threads), '--timeout', '300',
+         '--bind', f'127.0.0.1:{port}', 'app:server'],
+        cwd=work_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"gunicorn exited with code {process.returncode}, see {log_file.name}")
+        try:
+            if requests.get(url, timeout=5).status_code == 200:
+                return process, url
+        except (requests.ConnectionError, requests.Timeout):
+            # Not listening yet, or the workers are still importing the app
+            pass
+        time.sleep(1)
+    process.terminate()
+    sys.exit(f"The app did not start within {startup_timeout}s, see {log_file.name}")
+
+
+def load_callbacks(url):
+    # Request templates for the session callbacks, from the app's own dependency list
+    dependencies = requests.get(f'{url}/_dash-dependencies', timeout=30).json()
+    callbacks = {}
+    for name, output in SESSION_CALLBACKS.items():
+        for dependency in dependencies:
+            outputs = dependency['output'].strip('.').split('...')
+            if output in outputs and dependency.get('clientside_function') is None:
+                callbacks[name] = {
+                    'output': dependency['output'],
+                    'outputs': [dict(zip(('id', 'property'), spec.rsplit('.', 1))) for spec in outputs],
+                    'inputs': dependency['inputs'],
+                    'state': dependency['state'],
+                    'long': dependency.get('long'),  # Background callback: poll for the result
+                }
+                break
+        else:
+            sys.exit(f"No callback with the output {output} in the app")
+    return callbacks
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+
+    def record(self, name, seconds, error=None):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if error is not None:
+                self.errors[name] += 1
+                self.error_samples.setdefault(name, error)
+
+    def report(self, elapsed):
+        print(f"\n{'callback':<20}{'requests':>10}{'errors':>8}{'error %':>9}{'req/s':>8}"
+              f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        total_requests = total_errors = 0
+        for name in list(SESSION_CALLBACKS) + ['total']:
+            if name == 'total':
+                latencies = np.concatenate([np.asarray(values) for values in self.latencies.values()] or [[]])
+                errors = total_errors
+            else:
+                latencies = np.asarray(self.latencies.get(name, []))
+                errors = self.errors.get(name, 0)
+                total_requests += len(latencies)
+                total_errors += errors
+            if len(latencies) == 0:
+                print(f"{name:<20}{0:>10}")
+                continue
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+            print(f"{name:<20}{len(latencies):>10}{errors:>8}{100 * errors / len(latencies):>9.1f}"
+                  f"{len(latencies) / elapsed:>8.1f}{p50:>9.0f}{p90:>9.0f}{p99:>9.0f}{latencies.max() * 1000:>9.0f}")
+        for name, error in self.error_samples.items():
+            print(f"first {name} error: {error}")
+
+
+class User:
+    # One browser tab: keeps the values of the app's components and sends what the Dash
+    # renderer would send when they change
+    def __init__(self, url, callbacks, stats, rng, args):
+        self.url = url
+        self.callbacks = callbacks
+        self.stats = stats
+        self.rng = rng
+        self.args = args
+        self.session = requests.Session()
+        self.visible = []  # Names of the dots on the map
+        self.values = {
+            'year-slider.value': 1,
+            'occupation-dropdown.value': 'All',
+            'filtered-links.children': None,
+            'related-request.data': None,
+            'group-dropdown.value': args.group,
+            'direction-dropdown.value': 'both',
+            'world-map.clickData': None,
+            'wikipedia-link.children': 'Select any Dot',
+            'connection-path.children': None,
+            'world-map.relayoutData': None,
+            'map-container.n_clicks': 0,
+            'open-modal-button.n_clicks': 0,
+            'close-modal-button.n_clicks': 0,
+            'modal.style': {'display': 'none'},
+        }
+
+    def call(self, name, changed):
+        spec = self.callbacks[name]
+        body = {
+            'output': spec['output'],
+            'outputs': spec['outputs'],
+            'inputs': [dict(item, value=self.values.get(f"{item['id']}.{item['property']}")) for item in spec['inputs']],
+            'state': [dict(item, value=self.values.get(f"{item['id']}.{item['property']}")) for item in spec['state']],
+            'changedPropIds': changed,
+        }
+        start_time = time.perf_counter()
+        params = {}
+        while True:
+            try:
+                response = self.session.post(f'{self.url}/_dash-update-component', params=params, json=body,
+                                             timeout=self.args.timeout)
+            except requests.RequestException as e:
+                self.stats.record(name, time.perf_counter() - start_time, type(e).__name__)
+                return None
+            if response.status_code != 200 or spec['long'] is None or 'response' in response.json():
+                break
+            # A background job: the first answer names it, then the renderer polls until it is done
+            # (the latency recorded is the whole wait)
+            params = params or {'cacheKey': response.json()['cacheKey'], 'job': response.json()['job']}
+            time.sleep(spec['long']['interval'] / 1000)
+        seconds = time.perf_counter() - start_time
+        if response.status_code == 204:
+            # PreventUpdate
+            self.stats.record(name, seconds)
+            return None
+        if response.status_code != 200:
+            self.stats.record(name, seconds, f'HTTP {response.status_code}')
+            return None
+        self.stats.record(name, seconds)
+
+        # Keep the new component values, as the renderer would
+        result = response.json()['response']
+        for component_id, props in result.items():
+            for prop, value in props.items():
+                self.values[f"{component_id}.{prop.split('@')[0]}"] = value
+        return result
+
+    def update_map(self, changed):
+        result = self.call('update_map', [changed])
+        if result:
+            self.visible = [name for trace in result['world-map']['figure'].get('data', [])
+                            for name in trace.get('hovertext') or []]
+
+    def drag(self):
+        # A burst of small slider steps, one request per step (updatemode='drag')
+        position = float(self.values['year-slider.value'] or 0)
+        direction = self.rng.choice([-1, 1])
+        for _ in range(self.rng.integers(3, self.args.burst + 1)):
+            position = min(max(position + direction * self.rng.uniform(0.002, 0.02), 0.0), 1.0)
+            self.values['year-slider.value'] = position
+            self.update_map('year-slider.value')
+            time.sleep(self.rng.uniform(0.03, 0.1))
+
+    def click_dot(self):
+        # Clicking a dot selects the figure, then the map redraws with its related figures
+        if not self.visible:
+            return self.drag()
+        self.values['world-map.clickData'] = {'points': [{'hovertext': str(self.rng.choice(self.visible))}]}
+        result = self.call('update_click_data', ['world-map.clickData'])
+        if result and self.values['related-request.data']:
+            # Group options searched in the background
+            result = self.call('find_related_figures', ['related-request.data'])
+        if result:
+            self.update_map('filtered-links.children')
+
+    def open_modal(self):
+        self.values['open-modal-button.n_clicks'] += 1
+        self.call('toggle_modal', ['open-modal-button.n_clicks'])
+        time.sleep(self.rng.uniform(0.5, 2.0))
+        self.values['close-modal-button.n_clicks'] += 1
+        self.call('toggle_modal', ['close-modal-button.n_clicks'])
+
+    def run(self, stop_time):
+        self.update_map('year-slider.value')  # Initial page load
+        actions = [self.drag, self.click_dot, self.open_modal]
+        weights = np.array([self.args.drag_weight, self.args.click_weight, self.args.modal_weight], dtype=float)
+        while time.time() < stop_time:
+            actions[self.rng.choice(len(actions), p=weights / weights.sum())]()
+            time.sleep(self.rng.uniform(*self.args.think))
+
+
+def run_load(url, args):
+    callbacks = load_callbacks(url)
+    stats = Stats()
+    start_time = time.time()
+    stop_time = start_time + args.duration
+    threads = []
+    for i in range(args.users):
+        user = User(url, callbacks, stats, np.random.default_rng(args.seed + i), args)
+        thread = threading.Thread(target=user.run, args=(stop_time,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        # Users arrive over the ramp-up period
+        time.sleep(args.ramp_up / max(args.users, 1))
+    for thread in threads:
+        thread.join(timeout=max(stop_time - time.time(), 0) + args.timeout)
+    stats.report(time.time() - start_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help="test an app that is already running, instead of starting one")
+    parser.add_argument('--database-url', help="seed this database instead of an embedded one (its "
+                                               "top_figures and occupation_ranks tables are replaced)")
+    parser.add_argument('--work-dir', help="scratch directory (default: a new temporary directory)")
+    parser.add_argument('--figures', type=int, default=10000, help="synthetic figures to seed")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=60, help="seconds of load after the ramp-up starts")
+    parser.add_argument('--ramp-up', type=float, default=10, help="seconds over which the users arrive")
+    parser.add_argument('--think', type=float, nargs=2, default=[0.5, 2.0], help="pause between actions (min, max seconds)")
+    parser.add_argument('--burst', type=int, default=12, help="most slider steps in one drag")
+    parser.add_argument('--drag-weight', type=float, default=0.6)
+    parser.add_argument('--click-weight', type=float, default=0.3)
+    parser.add_argument('--modal-weight', type=float, default=0.1)
+    parser.add_argument('--group', default='neighbors', help="relatedness mode selected by the users")
+    parser.add_argument('--timeout', type=float, default=60, help="request timeout in seconds")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.url:
+        run_load(args.url.rstrip('/'), args)
+        sys.exit(0)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='wikimap_load_')
+    os.makedirs(work_dir, exist_ok=True)
+    print(f"Working in {work_dir}")
+
+    database = None
+    if args.database_url:
+        database_url = args.database_url
+    else:
+        database, database_url = start_embedded_database(work_dir)
+    seed_database(database_url, work_dir, args.figures, args.seed)
+
+    app_process, url = start_app(work_dir, database_url, args.workers, args.threads, args.startup_timeout)
+    print(f"App running at {url} with {args.workers} workers; {args.users} users for {args.duration:.0f}s")
+    try:
+        run_load(url, args)
+    finally:
+        app_process.terminate()
+        app_process.wait()
+        if database is not None:
+            database.cleanup()
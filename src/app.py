@@ -1,8 +1,9 @@
 import dash
-from dash import html, Input, Output, State, callback, no_update, ALL
+from dash import html, Input, Output, State, callback, clientside_callback, ClientsideFunction, no_update, ALL
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
 import plotly.express as px
+import plotly.graph_objects as go
 import numpy as np
 import communities
 from data_processing import (
@@ -10,11 +11,24 @@ from data_processing import (
     get_max_year,
     get_unique_occupations,
     get_figures_for_year,
+    get_figures_for_range,
     get_figure_data,
     get_all_article_names,
     get_birth_year,
+    get_figures_by_ids,
+    get_alive_counts,
+    get_data_version,
+    get_figure_table,
 )
-from layout import create_app_layout, map_to_year
+from layout import create_app_layout, create_alive_sparkline, map_to_year, year_to_slider
+from timeline import get_timeline_frames, frame_at_year
+from shared_cache import SharedCache
+from prefetch import Prefetcher, neighbor_years
+from tiles import open_tile_store
+from background_jobs import create_job_manager, run_once
+from flask import Response, request
+import plotly.io as pio
+import json
 import warnings
 import ast
 import os
@@ -31,66 +45,89 @@ server = app.server
 min_year = get_min_year()  # Fetch minimum year from DB
 max_year = get_max_year()  # Fetch current year as max year
 unique_occupations = get_unique_occupations()  # Fetch unique occupations from DB
+article_names = get_all_article_names()  # Fetch article names for the connection dropdown
 
 # Create the app layout
-app.layout = create_app_layout(unique_occupations, min_year, max_year)
+app.layout = create_app_layout(unique_occupations, min_year, max_year, article_names)
 
 # Initialize the FigureGroupFinder
 figure_finder = communities.FigureGroupFinder(None)
 
+# Group options searched by a background job rather than within the request
+BACKGROUND_GROUPS = {'hops_2', 'hops_3', 'influence', 'louvain'}
+
 # Random number generator with a fixed seed
 rng = np.random.default_rng(seed=42)
 
-def get_app_title(selected_occupation, article_name, year):
+# Map payloads and figure cards, shared by all worker processes on the host
+shared_cache = SharedCache()
+
+@server.route('/cache-stats')
+def cache_stats():
+    return shared_cache.stats()
+
+# Pre-built tiles for very large figure sets (scale mode), if configured
+tile_store = open_tile_store()
+
+# Binary points of one tile (see tiles.POINT_DTYPE), most important first
+@server.route('/tiles/<int:zoom>/<int(signed=True):century>/<int:x>/<int:y>')
+def tile_points(zoom, century, x, y):
+    if tile_store is None:
+        return Response("Scale mode is off", status=404)
+    if x >= 2 ** zoom or y >= 2 ** zoom:
+        return Response(f"No tile {x}/{y} at zoom {zoom}", status=404)
+    year, limit = request.args.get('year'), request.args.get('limit')
+    if year is not None:
+        try:
+            year = int(year)
+        except ValueError:
+            return Response("year must be an integer", status=400)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return Response("limit must be an integer", status=400)
+        if limit < 0:
+            return Response("limit must not be negative", status=400)
+    points = tile_store.tile(zoom, century, x, y)
+    if year is not None:
+        points = points[(points['birth'] <= year) & (points['death'] >= year)]
+    if limit is not None:
+        points = points[:limit]
+    return Response(points.tobytes(), mimetype='application/octet-stream',
+                    headers={'X-Point-Count': str(len(points)), 'Cache-Control': 'public, max-age=3600'})
+
+# Figure card from the shared cache, or from the database on a miss
+def get_figure_card(article_name):
+    shared_cache.set_version(get_data_version())
+    figure_data = shared_cache.get('card', article_name)
+    if figure_data is None:
+        figure_data = get_figure_data(article_name)
+        if figure_data:
+            shared_cache.put('card', article_name, figure_data)
+    return figure_data
+
+def get_app_title(selected_occupation, article_name, year, end_year=None):
+    period = f"in {year}" if end_year is None else f"between {year} and {end_year}"
     if article_name is not None and selected_occupation == "All":
         selected_occupation = selected_occupation.capitalize()
-        app_title = f"Figures Related to {article_name} Alive in {year}"
+        app_title = f"Figures Related to {article_name} Alive {period}"
     elif article_name is not None and selected_occupation != "All":
-        app_title = f"Figures Related to {article_name} Alive in {year} with the Occupation {selected_occupation}"
+        app_title = f"Figures Related to {article_name} Alive {period} with the Occupation {selected_occupation}"
     elif article_name is None and selected_occupation != "All":
-        app_title = f"Figures Alive in {year} with the Occupation {selected_occupation}"
+        app_title = f"Figures Alive {period} with the Occupation {selected_occupation}"
     else:
-        app_title = f"Important Figures Alive in {year}"
+        app_title = f"Important Figures Alive {period}"
     return app_title
 
-# Callback to update the map, app title, and loading overlay
-# app.py (continued)
-
-@callback(
-    [Output('world-map', 'figure'),
-     Output('app-title', 'children'),
-     Output('loading-overlay', 'style')],
-    [Input('year-slider', 'value'),
-     Input('occupation-dropdown', 'value'),
-     Input('filtered-links', 'children'),
-     Input('group-dropdown', 'value'),
-     Input('world-map', 'clickData'),
-     Input('wikipedia-link', 'children')],
-    [State('world-map', 'relayoutData')]
-)
-def update_map(slider_value, selected_occupation, filtered_links, group_option, click_data, article_name, relayoutData):
-    import time
-    start_time = time.time()
-    
-    # Show loading overlay
-    loading_style = {
-        "position": "absolute",
-        "top": 0,
-        "left": 0,
-        "width": "100%",
-        "height": "100%",
-        "backgroundColor": "rgba(255, 255, 255, 0.5)",
-        "display": "flex",
-        "justifyContent": "center",
-        "alignItems": "center",
-        "zIndex": 1000,
-    }
-
-    selected_year = map_to_year(slider_value, min_year, max_year)
-
+# Build the map of the figures alive in a year (without the viewport, which is set per request)
+def build_map_figure(selected_year, selected_occupation, filtered_links, connection_path, table=None):
     # Fetch data from the database
-    df_filtered = get_figures_for_year(selected_year, selected_occupation, filtered_links)
+    df_filtered = get_figures_for_year(selected_year, selected_occupation, filtered_links, table)
+    return map_figure(df_filtered, connection_path, table)
 
+# Scatter map of a frame of figures, with the chain of links of connection_path on top
+def map_figure(df_filtered, connection_path=None, table=None):
     # Ensure correct data types
     df_filtered['birth'] = df_filtered['birth'].astype(str)
     df_filtered['death'] = df_filtered['death'].fillna('').astype(str)
@@ -122,21 +159,22 @@ def update_map(slider_value, selected_occupation, filtered_links, group_option,
         customdata=df_filtered[['birth', 'death']].values
     )
 
-    # Preserve the viewport state if the user has interacted with the map
-    if relayoutData and 'mapbox.center' in relayoutData:
-        center = relayoutData['mapbox.center']
-        zoom = relayoutData['mapbox.zoom']
-    else:
-        # Set to initial center and zoom to display the entire world
-        center = {"lat": 20, "lon": -25}  # Equator and Prime Meridian intersection
-        zoom = 0.5  # Zoom level that shows the entire globe
+    # Draw the chain of links between two figures on top of the dots
+    if connection_path and connection_path != "None":
+        df_path = get_figures_by_ids(ast.literal_eval(connection_path), table)
+        fig.add_trace(go.Scattermapbox(
+            lat=pd.to_numeric(df_path['latitude'], errors='coerce'),
+            lon=pd.to_numeric(df_path['longitude'], errors='coerce'),
+            mode='lines+markers',
+            hovertext=df_path['article_name'],
+            hovertemplate="<b>%{hovertext}</b><extra></extra>",
+            line=dict(width=3, color="#333"),
+            marker=dict(size=9, color="#333"),
+            showlegend=False
+        ))
 
     fig.update_layout(
         mapbox_style="open-street-map",
-        mapbox=dict(
-            center=center,
-            zoom=zoom
-        ),
         margin={"r": 0, "t": 0, "l": 0, "b": 0},
         coloraxis_colorbar=dict(
             title=dict(
@@ -156,10 +194,124 @@ def update_map(slider_value, selected_occupation, filtered_links, group_option,
         )
     )
 
+    return fig
+
+# Compute a year next to the one shown into the shared cache, while the worker is idle
+# Runs on the prefetch thread, from the figure table and data version of the request that
+# scheduled it (the database connection belongs to the request threads)
+def prefetch_map(context, year, data):
+    table, version = data
+    cache_args = [year, *context]
+    if not shared_cache.contains('map', cache_args, version):
+        shared_cache.put('map', cache_args, pio.to_json(build_map_figure(year, *context, table=table)), version)
+
+prefetcher = Prefetcher(prefetch_map)
+server.before_request(prefetcher.request_started)
+server.teardown_request(lambda exc: prefetcher.request_finished())
+
+# The figure for a year and selection is prepared once for all workers; only the viewport
+# is applied per request
+def cached_map_figure(selected_year, selected_occupation, filtered_links, connection_path, slider_value):
+    shared_cache.set_version(get_data_version())
+    cache_args = [selected_year, selected_occupation, filtered_links, connection_path]
+    fig = shared_cache.get('map', cache_args)
+    if fig is None:
+        fig = json.loads(pio.to_json(build_map_figure(selected_year, selected_occupation, filtered_links, connection_path)))
+        shared_cache.put('map', cache_args, fig)
+
+    # Warm the years of the next slider steps, so the next drag step is a cache hit
+    context = (selected_occupation, filtered_links, connection_path)
+    previous_value = prefetcher.move(context, slider_value)
+    prefetcher.schedule(context, neighbor_years(slider_value, previous_value,
+                                                lambda x: map_to_year(x, min_year, max_year)),
+                        (get_figure_table(), shared_cache.version))
+    return fig
+
+# Callback to update the map, app title, and loading overlay
+# app.py (continued)
+
+@callback(
+    [Output('world-map', 'figure'),
+     Output('app-title', 'children'),
+     Output('loading-overlay', 'style')],
+    [Input('year-slider', 'value'),
+     Input('occupation-dropdown', 'value'),
+     Input('filtered-links', 'children'),
+     Input('group-dropdown', 'value'),
+     Input('world-map', 'clickData'),
+     Input('wikipedia-link', 'children'),
+     Input('connection-path', 'children'),
+     Input('world-map', 'relayoutData'),
+     Input('range-mode', 'value'),
+     Input('year-range-slider', 'value')]
+)
+def update_map(slider_value, selected_occupation, filtered_links, group_option, click_data, article_name, connection_path, relayoutData,
+               range_mode=None, range_value=None):
+    import time
+    start_time = time.time()
+    
+    # Show loading overlay
+    loading_style = {
+        "position": "absolute",
+        "top": 0,
+        "left": 0,
+        "width": "100%",
+        "height": "100%",
+        "backgroundColor": "rgba(255, 255, 255, 0.5)",
+        "display": "flex",
+        "justifyContent": "center",
+        "alignItems": "center",
+        "zIndex": 1000,
+    }
+
+    selected_year = map_to_year(slider_value, min_year, max_year)
+    end_year = None
+
+    # Panning and zooming only need a new figure in scale mode, where the visible tiles change
+    range_mode = bool(range_mode) and range_value is not None
+    scale_mode = (tile_store is not None and not range_mode and selected_occupation == "All"
+                  and (not filtered_links or filtered_links == "None")
+                  and (not connection_path or connection_path == "None"))
+    triggered_id = dash.callback_context.triggered[0]['prop_id'] if dash.callback_context.triggered else ''
+    if triggered_id == 'world-map.relayoutData' and not (scale_mode and relayoutData and 'mapbox.center' in relayoutData):
+        raise PreventUpdate
+
+    if range_mode:
+        # The most important figures alive at some point in the range of years
+        selected_year, end_year = (map_to_year(x, min_year, max_year) for x in range_value)
+        shared_cache.set_version(get_data_version())
+        cache_args = [selected_year, end_year, selected_occupation, filtered_links, connection_path]
+        fig = shared_cache.get('range', cache_args)
+        if fig is None:
+            df_range = get_figures_for_range(selected_year, end_year, selected_occupation, filtered_links)
+            fig = json.loads(pio.to_json(map_figure(df_range, connection_path)))
+            shared_cache.put('range', cache_args, fig)
+    elif scale_mode:
+        # The most important figures of the visible tiles, read from the tile store
+        if relayoutData and 'mapbox.center' in relayoutData:
+            view_center, view_zoom = relayoutData['mapbox.center'], relayoutData['mapbox.zoom']
+        else:
+            view_center, view_zoom = {"lat": 20, "lon": -25}, 0.5
+        corners = (relayoutData or {}).get('mapbox._derived', {}).get('coordinates')
+        df_view = tile_store.figures_in_view(selected_year, view_center, view_zoom, corners)
+        fig = json.loads(pio.to_json(map_figure(df_view)))
+    else:
+        fig = cached_map_figure(selected_year, selected_occupation, filtered_links, connection_path, slider_value)
+
+    # Preserve the viewport state if the user has interacted with the map
+    if relayoutData and 'mapbox.center' in relayoutData:
+        center = relayoutData['mapbox.center']
+        zoom = relayoutData['mapbox.zoom']
+    else:
+        # Set to initial center and zoom to display the entire world
+        center = {"lat": 20, "lon": -25}  # Equator and Prime Meridian intersection
+        zoom = 0.5  # Zoom level that shows the entire globe
+    fig['layout'].setdefault('mapbox', {}).update(center=center, zoom=zoom)
+
     # Set the app title
     if article_name == "Select any Dot":
         article_name = None
-    app_title = get_app_title(selected_occupation, article_name, selected_year)
+    app_title = get_app_title(selected_occupation, article_name, selected_year, end_year)
 
     # Hide loading overlay
     loading_style["display"] = "none"
@@ -169,6 +321,83 @@ def update_map(slider_value, selected_occupation, filtered_links, group_option,
 
     return fig, app_title, loading_style
 
+# Callback to switch between the year slider and the range slider
+@callback(
+    Output('year-slider-wrapper', 'style'),
+    Output('year-range-wrapper', 'style'),
+    Input('range-mode', 'value')
+)
+def toggle_range_mode(range_mode):
+    if range_mode:
+        return {'display': 'none'}, {'display': 'block'}
+    return {'display': 'block'}, {'display': 'none'}
+
+# Callback to draw how many figures (of the selected occupation) are alive in every year
+@callback(
+    Output('alive-sparkline', 'figure'),
+    Input('occupation-dropdown', 'value')
+)
+def update_alive_sparkline(selected_occupation):
+    alive_counts = get_alive_counts(selected_occupation, min_year, max_year, get_data_version())
+    return create_alive_sparkline(alive_counts, min_year, max_year)
+
+# Callback to jump to the year clicked on the sparkline
+@callback(
+    Output('year-slider', 'value', allow_duplicate=True),
+    Input('alive-sparkline', 'clickData'),
+    prevent_initial_call=True
+)
+def jump_to_sparkline_year(click_data):
+    if not click_data:
+        raise PreventUpdate
+    return click_data['points'][0]['x']
+
+# Callback to start timeline playback from the selected year, and to pause it (also when the
+# occupation or step changes); pausing moves the slider to the year reached, so the map is
+# redrawn by update_map with the current filters
+@callback(
+    Output('playback-frames', 'data'),
+    Output('playback-interval', 'disabled'),
+    Output('play-button', 'children'),
+    Output('year-slider', 'value', allow_duplicate=True),
+    Input('play-button', 'n_clicks'),
+    Input('occupation-dropdown', 'value'),
+    Input('playback-step', 'value'),
+    State('year-slider', 'value'),
+    State('playback-interval', 'disabled'),
+    State('playback-year', 'data'),
+    prevent_initial_call=True
+)
+def toggle_playback(n_clicks, selected_occupation, step, slider_value, paused, playback_year):
+    triggered_id = dash.callback_context.triggered[0]['prop_id'].split('.')[0]
+    if triggered_id == 'play-button' and paused:
+        frames = dict(get_timeline_frames(selected_occupation, step, min_year, max_year, get_data_version()))
+        start_year = map_to_year(slider_value, min_year, max_year)
+        frames['start'] = frame_at_year(frames, start_year if start_year < max_year else min_year)
+        frames['title'] = get_app_title(selected_occupation, None, '{year}')
+        frames['playback'] = n_clicks  # Every press starts over from the start frame, even at the same year
+        return frames, False, 'Pause', no_update
+    if paused:
+        raise PreventUpdate
+
+    slider_value = year_to_slider(playback_year, min_year, max_year) if playback_year is not None else no_update
+    return no_update, True, 'Play', slider_value
+
+# Every playback tick is applied in the browser (assets/timeline.js), without a server call
+clientside_callback(
+    ClientsideFunction(namespace='timeline', function_name='advance'),
+    Output('world-map', 'figure', allow_duplicate=True),
+    Output('app-title', 'children', allow_duplicate=True),
+    Output('playback-year', 'data'),
+    Output('playback-interval', 'disabled', allow_duplicate=True),
+    Output('year-slider', 'value', allow_duplicate=True),
+    Output('play-button', 'children', allow_duplicate=True),
+    Input('playback-interval', 'n_intervals'),
+    State('playback-frames', 'data'),
+    State('world-map', 'figure'),
+    prevent_initial_call=True
+)
+
 # Import additional dependencies if not already present
 from dash import html
 
@@ -179,20 +408,22 @@ from dash import html
         Output('wikipedia-link', 'children'),
         Output('wikipedia-link', 'style'),  # New Output for styling
         Output('description-display', 'children'),
-        Output('filtered-links', 'children'),
+        Output('filtered-links', 'children', allow_duplicate=True),
+        Output('related-request', 'data'),
         Output('world-map', 'clickData', allow_duplicate=True)
     ],
     [
         Input('world-map', 'clickData'),
         Input('map-container', 'n_clicks'),
-        Input('group-dropdown', 'value')
+        Input('group-dropdown', 'value'),
+        Input('direction-dropdown', 'value')
     ],
     [
         State('world-map', 'clickData')
     ],
     prevent_initial_call=True
 )
-def update_click_data(click_data, n_clicks, group_option, current_click_data):
+def update_click_data(click_data, n_clicks, group_option, direction, current_click_data):
     ctx = dash.callback_context
     triggered_id = ctx.triggered[0]['prop_id'].split('.')[0]
 
@@ -216,6 +447,7 @@ def update_click_data(click_data, n_clicks, group_option, current_click_data):
             },
             "",  # Clear description
             None,  # Clear filtered links
+            None,  # Cancel a search for related figures still running
             None  # Reset clickData
         )
 
@@ -223,7 +455,7 @@ def update_click_data(click_data, n_clicks, group_option, current_click_data):
     article_name = click_data['points'][0]['hovertext']
 
     # Fetch data about the figure from the database
-    figure_data = get_figure_data(article_name)
+    figure_data = get_figure_card(article_name)
     if not figure_data:
         raise PreventUpdate
 
@@ -232,14 +464,16 @@ def update_click_data(click_data, n_clicks, group_option, current_click_data):
     description = figure_data['description']
     main_id = figure_data['page_id']
 
-    figure_finder.main_id = main_id
-
-    if group_option == 'neighbors':
-        related_ids = figure_finder.get_neighbors()
-    elif group_option == 'louvain':
-        related_ids = figure_finder.get_cluster_members()
+    # Direct neighbors are found right away; heavier searches run as a background job
+    # (find_related_figures), and until it is done the map shows only the selected figure
+    if group_option in BACKGROUND_GROUPS:
+        if group_option == 'louvain':
+            # Jobs are forked from this process, so clusters a job detected and saved are loaded
+            # here, once, rather than unpickled again by every later job
+            figure_finder.load_clusters()
+        related_links, related_request = str([main_id]), {'page_id': main_id, 'group': group_option, 'direction': direction}
     else:
-        related_ids = []
+        related_links, related_request = str(related_figures(main_id, group_option, direction)), None
 
     article_display_text = article_name
     full_display_text = f"{description} (ranked: {rank}{ordinal_suffix(rank)})"
@@ -264,10 +498,101 @@ def update_click_data(click_data, n_clicks, group_option, current_click_data):
         article_display_text,  # Display the figure's name
         link_style,  # Apply link styling
         full_display_text,  # Update description
-        str(related_ids),  # Update filtered links
+        related_links,  # Update filtered links
+        related_request,  # Start (or cancel) a background search
         None  # Reset clickData
     )
 
+def related_figures(main_id, group_option, direction):
+    if group_option == 'neighbors':
+        return figure_finder.get_neighbors(main_id, direction)
+    elif group_option in ('hops_2', 'hops_3'):
+        return figure_finder.get_k_hop_neighbors(main_id, hops=int(group_option[-1]), direction=direction)
+    elif group_option == 'influence':
+        return figure_finder.get_influence_related(main_id)
+    elif group_option == 'louvain':
+        return figure_finder.get_cluster_members(main_id)
+    return []
+
+# Figures related to the selected one, for the group options in BACKGROUND_GROUPS. Runs as
+# a background job (background_jobs.py): a new selection or the Cancel button stops the job
+# still running, and identical searches, running or finished, are only computed once. A job
+# is a forked process, so what it adds to figure_finder's LRU caches is lost when it exits;
+# reuse of these searches comes from the job manager's result cache instead, which is keyed
+# by the same arguments and shared by all workers.
+def find_related_figures(set_progress, related_request):
+    if not related_request:
+        return [no_update]  # Only cancels the job still running, if any
+    main_id, group_option, direction = related_request['page_id'], related_request['group'], related_request['direction']
+    cold_clusters = group_option == 'louvain' and not figure_finder.load_clusters()
+    steps = 2 if cold_clusters else 1
+
+    def waiting(step):
+        return lambda: set_progress((str(step), str(steps), "Waiting for the same search by another user"))
+
+    if cold_clusters:
+        # No saved clusters yet: one job detects the communities and saves them, the others
+        # wait for it and load the saved clusters
+        set_progress(('0', str(steps), "Detecting communities (first use, this takes a while)"))
+        run_once(('clusters', figure_finder.cluster_backend), figure_finder.load_or_calculate_clusters, waiting(0))
+        figure_finder.load_clusters()
+
+    set_progress((str(steps - 1), str(steps), "Finding related figures"))
+    related_ids = run_once(('related', main_id, group_option, direction),
+                           lambda: related_figures(main_id, group_option, direction), waiting(steps - 1))
+    return [str(related_ids)]
+
+job_manager = create_job_manager(cache_by=[get_data_version])
+if job_manager is not None:
+    callback(
+        [Output('filtered-links', 'children')],  # A list: Dash reads background results as multi-output
+        Input('related-request', 'data'),
+        background=True,
+        manager=job_manager,
+        progress=[Output('related-progress', 'value'), Output('related-progress', 'max'), Output('related-status', 'children')],
+        running=[
+            (Output('related-job', 'style'), {'display': 'flex', 'alignItems': 'center', 'marginTop': '5px'}, {'display': 'none'}),
+            (Output('map-container', 'style'), {'opacity': 0.6}, {}),  # Pending: the map is about to change
+        ],
+        cancel=[Input('cancel-related-button', 'n_clicks')],
+        interval=250,  # Milliseconds between the browser's polls for the result
+        prevent_initial_call=True
+    )(find_related_figures)
+else:
+    # No job manager (diskcache is not installed): search within the request
+    @callback(
+        [Output('filtered-links', 'children')],
+        Input('related-request', 'data'),
+        prevent_initial_call=True
+    )
+    def update_related_figures(related_request):
+        return find_related_figures(lambda progress: None, related_request)
+
+# Callback to find the shortest chain of Wikipedia links between the selected figure and another one
+@callback(
+    Output('connection-path', 'children'),
+    Output('connection-display', 'children'),
+    Input('wikipedia-link', 'children'),
+    Input('connect-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def update_connection_path(article_name, target_name):
+    if article_name == "Select any Dot" or not target_name:
+        return None, ""
+
+    source_data = get_figure_card(article_name)
+    target_data = get_figure_card(target_name)
+    if not source_data or not target_data:
+        return None, ""
+
+    path = figure_finder.get_shortest_path(source_data['page_id'], target_data['page_id'])
+    if path is None:
+        return None, f"No chain of links from {article_name} to {target_name} was found"
+
+    df_path = get_figures_by_ids(path)
+    links = len(path) - 1
+    return str(path), f"{links} link{'s' if links != 1 else ''}: " + " → ".join(df_path['article_name'])
+
 # Callback to toggle the modal visibility and populate its content
 @callback(
     Output('modal', 'style'),
@@ -0,0 +1,69 @@
+// Timeline playback: applies the delta frames built by timeline.get_timeline_frames to the
+// set of figures on the map, so each frame costs only the figures entering and leaving it.
+// Outputs: map figure, title, year reached, interval disabled, slider value, button label.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    timeline: {
+        advance: function (nIntervals, frames, figure) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!frames || !figure) {
+                return [noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate];
+            }
+
+            let state = window.timelineState;
+            if (!state || state.token !== frames.token || state.playback !== frames.playback) {
+                // New playback (a new press of Play): the figures alive in the start frame
+                const n = frames.first.length;
+                state = {token: frames.token, playback: frames.playback, frame: frames.start, alive: [], slot: new Int32Array(n).fill(-1)};
+                for (let i = 0; i < n; i++) {
+                    if (frames.first[i] <= state.frame && state.frame <= frames.last[i]) {
+                        state.slot[i] = state.alive.length;
+                        state.alive.push(i);
+                    }
+                }
+                window.timelineState = state;
+            } else if (state.frame + 1 < frames.years.length) {
+                const k = ++state.frame;
+                // Swap-remove the figures leaving the map, then append the ones entering it
+                for (let j = frames.leave_offsets[k]; j < frames.leave_offsets[k + 1]; j++) {
+                    const i = frames.leave[j];
+                    const position = state.slot[i];
+                    if (position < 0) continue;
+                    const moved = state.alive.pop();
+                    if (moved !== i) {
+                        state.alive[position] = moved;
+                        state.slot[moved] = position;
+                    }
+                    state.slot[i] = -1;
+                }
+                for (let j = frames.enter_offsets[k]; j < frames.enter_offsets[k + 1]; j++) {
+                    const i = frames.enter[j];
+                    if (state.slot[i] >= 0) continue;
+                    state.slot[i] = state.alive.length;
+                    state.alive.push(i);
+                }
+            } else {
+                // End of the timeline: stop, and let the server draw the last year as usual
+                window.timelineState = null;
+                return [noUpdate, noUpdate, frames.max_year, true, 1, 'Play'];
+            }
+
+            const year = frames.years[state.frame];
+            const points = frames.points;
+            const alive = state.alive;
+            const trace = {
+                type: 'scattermapbox',
+                mode: 'markers',
+                lat: alive.map(i => points.lat[i]),
+                lon: alive.map(i => points.lon[i]),
+                hovertext: alive.map(i => points.name[i]),
+                customdata: alive.map(i => [points.birth[i], points.death[i]]),
+                hovertemplate: '<b>%{hovertext}</b><br><br>Birth: %{customdata[0]}<br>Death: %{customdata[1]}<extra></extra>',
+                marker: {color: alive.map(i => points.color[i]), coloraxis: 'coloraxis'},
+                showlegend: false
+            };
+            const layout = Object.assign({}, figure.layout, {uirevision: 'timeline'});
+            return [{data: [trace], layout: layout}, frames.title.replace('{year}', year), year,
+                    noUpdate, noUpdate, noUpdate];
+        }
+    }
+});
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+
+# Long-running relatedness and graph work runs in Dash background callbacks: every job is a
+# process forked from the worker (so it starts with the graph already in memory), and its
+# progress and result go through a diskcache directory shared by all the workers on the
+# host. The worker itself only starts jobs and answers the browser's polls, so a multi-hop
+# search or a cold community detection no longer holds up other users' requests. Without
+# diskcache (pip install "dash[diskcache]"), the same callbacks run inside the request.
+try:
+    import diskcache
+    import psutil
+    from dash import DiskcacheManager
+except ImportError:
+    diskcache = None
+
+JOB_CACHE_DIR = os.environ.get('JOB_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'wikimap_jobs'))
+JOB_CACHE_MB = int(os.environ.get('JOB_CACHE_MB', 256))
+JOB_RESULT_TTL = 3600  # Seconds a finished result is kept for identical requests
+CLAIM_TTL = 600  # Longest a job may hold a claim, even if its process is never seen to exit
+SHARED_RESULT_TTL = 60  # Seconds a shared result waits for the jobs that are waiting on it
+CLAIM_POLL = 0.05
+
+job_cache = diskcache.Cache(JOB_CACHE_DIR, size_limit=JOB_CACHE_MB * 1024 * 1024) if diskcache else None
+
+
+def create_job_manager(cache_by):
+    # Manager for background callbacks, or None (callbacks run in the request) without diskcache.
+    # Results are kept by their inputs and `cache_by`, so identical requests reuse them.
+    if job_cache is None:
+        return None
+    return DiskcacheManager(job_cache, cache_by=cache_by, expire=JOB_RESULT_TTL)
+
+
+def process_alive(pid):
+    # A killed job stays a zombie until its worker reaps it
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+def run_once(key, compute, on_wait=None):
+    # Result of compute() for `key`, computed by one job at a time: jobs started for the same
+    # key while it runs wait for it and reuse its result. If the job holding the claim is
+    # cancelled (its process is killed), the next waiter takes the claim over.
+    if job_cache is None:
+        return compute()
+    result_key, claim_key = ('result', *key), ('claim', *key)
+    missing = object()
+    waiting = False
+    while True:
+        result = job_cache.get(result_key, default=missing)
+        if result is not missing:
+            return result
+        if job_cache.add(claim_key, os.getpid(), expire=CLAIM_TTL):
+            try:
+                result = compute()
+                job_cache.set(result_key, result, expire=SHARED_RESULT_TTL)
+            finally:
+                job_cache.delete(claim_key)
+            return result
+
+        holder = job_cache.get(claim_key)
+        if holder is not None and not process_alive(holder):
+            with job_cache.transact():
+                if job_cache.get(claim_key) == holder:
+                    job_cache.delete(claim_key)
+            continue
+        if on_wait is not None and not waiting:
+            on_wait()
+            waiting = True
+        time.sleep(CLAIM_POLL)
@@ -1,68 +1,328 @@
 import pandas as pd
+import numpy as np
 import networkx as nx
+import igraph as ig
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import functools
+import itertools
 import pickle
+import random
 import os
 
+# Available community detection backends and the file each one caches its clusters in
+CLUSTER_BACKENDS = {
+    'networkx': 'louvain_clusters.pkl',
+    'igraph_louvain': 'igraph_louvain_clusters.pkl',
+    'igraph_leiden': 'leiden_clusters.pkl',
+}
+
+# Largest number of related figures sent to the map, and how many k-hop seeds are kept in memory
+MAX_RELATED_FIGURES = int(os.environ.get('MAX_RELATED_FIGURES', 1000))
+NEIGHBORHOOD_CACHE_SIZE = 256
+
+# Personalized PageRank settings for the "Related by influence" mode
+INFLUENCE_TOP_K = int(os.environ.get('INFLUENCE_TOP_K', 200))
+INFLUENCE_CACHE_SIZE = 256
+
+# Most figures a single shortest-path search may visit, and how many figure pairs are kept in memory
+PATH_NODE_BUDGET = int(os.environ.get('PATH_NODE_BUDGET', 5000))
+PATH_CACHE_SIZE = 512
+
+def edges_to_csr(rows, cols, n):
+    # Sort the edges by row and compute the offset of every row's slice in the column array
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32)
+
+def csr_gather(indptr, indices, rows):
+    # Concatenate the neighbor slices of all the given rows without a Python loop
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return indices[offsets]
+
+def detect_communities(node_ids, indptr, indices, backend='networkx', resolution=1, threshold=1e-07, seed=None):
+    if backend not in CLUSTER_BACKENDS:
+        raise ValueError(f"Unknown cluster backend '{backend}', expected one of {list(CLUSTER_BACKENDS)}")
+
+    # Edge list (as row numbers) of the CSR adjacency
+    sources = np.repeat(np.arange(len(node_ids), dtype=np.int32), np.diff(indptr))
+
+    if backend == 'networkx':
+        graph = nx.Graph()
+        graph.add_nodes_from(node_ids.tolist())
+        graph.add_edges_from(zip(node_ids[sources].tolist(), node_ids[indices].tolist()))
+        communities = nx.community.louvain_communities(
+            graph,
+            weight='weight',
+            resolution=resolution,
+            threshold=threshold,
+            seed=seed
+        )
+        clusters = {}
+        for i, community in enumerate(communities):
+            for node in community:
+                clusters[node] = i
+        return clusters
+
+    # igraph runs in its C core directly on the row numbers; reciprocal links are
+    # merged into a single undirected edge, as in nx.DiGraph.to_undirected()
+    graph = ig.Graph(n=len(node_ids), edges=np.column_stack((sources, indices)), directed=False)
+    graph.simplify(multiple=True, loops=False)
+    # igraph draws from Python's random module by default; a seeded run uses its own generator
+    # instead, so it neither reseeds nor advances the global one
+    if seed is not None:
+        ig.set_random_number_generator(random.Random(seed))
+    try:
+        if backend == 'igraph_leiden':
+            partition = graph.community_leiden(objective_function='modularity', resolution=resolution, n_iterations=-1)
+        else:
+            partition = graph.community_multilevel(resolution=resolution)
+    finally:
+        if seed is not None:
+            ig.set_random_number_generator(random)
+
+    return dict(zip(node_ids.tolist(), partition.membership))
+
 class FigureGroupFinder:
-    def __init__(self, main_id):
+    def __init__(self, main_id, cluster_backend=None):
         self.main_id = main_id
+        self.cluster_backend = cluster_backend or os.environ.get('CLUSTER_BACKEND', 'networkx')
         self.data = None
         self.graph = None
         self.clusters = None
+        self.clusters_mtime = 0.0  # Modification time of the cluster file the clusters came from
         self.load_data()
         self.build_graph()
-        self.load_or_calculate_clusters()
+        # Clusters saved by an earlier run; a cold detection only runs when they are first needed
+        self.load_clusters()
+        self.cached_k_hop_neighbors = functools.lru_cache(maxsize=NEIGHBORHOOD_CACHE_SIZE)(self.calculate_k_hop_neighbors)
+        self.cached_personalized_pagerank = functools.lru_cache(maxsize=INFLUENCE_CACHE_SIZE)(self.calculate_personalized_pagerank)
+        self.cached_shortest_path = functools.lru_cache(maxsize=PATH_CACHE_SIZE)(self.calculate_shortest_path)
     
     def load_data(self):
-        # Load the CSV file
         if os.environ.get('RENDER') == 'true':
             self.data_dir = ''
         else:
             self.data_dir = 'src/'
-        data_file = f'{self.data_dir}top_10000_people_articles.csv'
-        self.data = pd.read_csv(data_file)
+        data_file = f'{self.data_dir}top_10000_people_articles.parquet'
         
-        # Convert outgoing_link_ids to lists
-        self.data['outgoing_link_ids'] = self.data['outgoing_link_ids'].fillna('').apply(lambda x: [int(i) for i in x.split(',') if i])
+        if os.path.exists(data_file):
+            # Read only the needed columns; the native list column of links comes back as
+            # per-row counts and one flat array of targets, without parsing
+            table = pq.read_table(data_file, columns=['page_id', 'pagerank_score', 'outgoing_link_ids'])
+            links = table.column('outgoing_link_ids')
+            self.link_counts = pc.fill_null(pc.list_value_length(links), 0).to_numpy()
+            self.link_targets = pc.list_flatten(links).to_numpy().astype(np.int64)
+            self.data = table.drop(['outgoing_link_ids']).to_pandas()
+        else:
+            # Older data files are CSV, with the links as comma-separated strings
+            self.data = pd.read_csv(f'{self.data_dir}top_10000_people_articles.csv',
+                                    usecols=['page_id', 'pagerank_score', 'outgoing_link_ids'])
+            links = self.data.pop('outgoing_link_ids').fillna('').astype(str).apply(lambda x: [int(i) for i in x.split(',') if i])
+            self.link_counts = links.str.len().to_numpy()
+            self.link_targets = np.fromiter(itertools.chain.from_iterable(links), dtype=np.int64,
+                                            count=int(self.link_counts.sum()))
     
     def build_graph(self):
-        # Build a NetworkX graph from the data
+        # Flatten the adjacency lists into integer edge arrays
+        page_ids = self.data['page_id'].to_numpy(dtype=np.int64)
+        sources = np.repeat(page_ids, self.link_counts)
+        targets = self.link_targets
+
+        # Map page IDs to consecutive row numbers and drop duplicate links
+        self.node_ids = np.unique(np.concatenate([page_ids, targets]))
+        self.node_index = {page_id: i for i, page_id in enumerate(self.node_ids.tolist())}
+        n = len(self.node_ids)
+        edge_keys = np.unique(np.searchsorted(self.node_ids, sources) * n + np.searchsorted(self.node_ids, targets))
+        rows, cols = edge_keys // n, edge_keys % n
+
+        # Compact adjacency in both directions (CSR offsets + neighbor row numbers)
+        self.out_indptr, self.out_indices = edges_to_csr(rows, cols, n)
+        self.in_indptr, self.in_indices = edges_to_csr(cols, rows, n)
+
+        # PageRank score of every row, used to keep the most important figures of large neighborhoods
+        scores = pd.Series(self.data['pagerank_score'].to_numpy(), index=page_ids)
+        self.node_scores = scores.groupby(level=0).max().reindex(self.node_ids).fillna(0).to_numpy()
+
+        # Build a NetworkX graph from the same edges
         self.graph = nx.DiGraph()
-        for _, row in self.data.iterrows():
-            self.graph.add_node(row['page_id'])
-            for target in row['outgoing_link_ids']:
-                self.graph.add_edge(row['page_id'], target)
+        self.graph.add_nodes_from(self.node_ids.tolist())
+        self.graph.add_edges_from(zip(self.node_ids[rows].tolist(), self.node_ids[cols].tolist()))
     
+    def cluster_file(self):
+        return f'{self.data_dir}{CLUSTER_BACKENDS[self.cluster_backend]}'
+
+    def load_clusters(self):
+        # (Re)load the saved clusters if the file is newer than the ones in memory, e.g. when
+        # another process has just detected them
+        if os.path.exists(self.cluster_file()):
+            mtime = os.path.getmtime(self.cluster_file())
+            if self.clusters is None or mtime > self.clusters_mtime:
+                with open(self.cluster_file(), 'rb') as f:
+                    self.clusters = pickle.load(f)
+                self.clusters_mtime = mtime
+        return self.clusters is not None
+
     def load_or_calculate_clusters(self, resolution=1, threshold=1e-07, seed=None):
-        cluster_file = f'{self.data_dir}louvain_clusters.pkl'
-        if os.path.exists(cluster_file):
-            with open(cluster_file, 'rb') as f:
-                self.clusters = pickle.load(f)
-        else:
-            communities = nx.community.louvain_communities(
-                self.graph.to_undirected(),
-                weight='weight',
+        if not self.load_clusters():
+            self.clusters = detect_communities(
+                self.node_ids,
+                self.out_indptr,
+                self.out_indices,
+                backend=self.cluster_backend,
                 resolution=resolution,
                 threshold=threshold,
                 seed=seed
             )
-            self.clusters = {}
-            for i, community in enumerate(communities):
-                for node in community:
-                    self.clusters[node] = i
             
-            # Save the clusters
-            with open(cluster_file, 'wb') as f:
+            # Save the clusters; written aside and renamed, as other processes may be loading them
+            temp_file = f'{self.cluster_file()}.{os.getpid()}.tmp'
+            with open(temp_file, 'wb') as f:
                 pickle.dump(self.clusters, f)
+            os.replace(temp_file, self.cluster_file())
+            self.clusters_mtime = os.path.getmtime(self.cluster_file())
     
-    def get_neighbors(self):
+    # The query methods take the figure explicitly rather than reading self.main_id, as one
+    # finder is shared by all the threads serving requests
+    def get_neighbors(self, main_id, direction='both'):
         # Get all IDs having links to and from the main ID
-        outgoing = set(self.graph.successors(self.main_id))
-        incoming = set(self.graph.predecessors(self.main_id))
+        outgoing = set(self.graph.successors(main_id)) if direction in ('both', 'out') else set()
+        incoming = set(self.graph.predecessors(main_id)) if direction in ('both', 'in') else set()
         return list(outgoing.union(incoming))
     
-    def get_cluster_members(self):
-        if self.main_id not in self.clusters:
+    def get_k_hop_neighbors(self, main_id, hops=2, direction='both', limit=MAX_RELATED_FIGURES):
+        if main_id not in self.node_index:
+            return []
+        return list(self.cached_k_hop_neighbors(main_id, hops, direction, limit))
+
+    def calculate_k_hop_neighbors(self, main_id, hops, direction, limit):
+        if direction not in ('both', 'out', 'in'):
+            raise ValueError(f"Unknown link direction '{direction}', expected 'both', 'out' or 'in'")
+
+        # Frontier-based BFS over the CSR arrays, one vectorized step per hop
+        visited = np.zeros(len(self.node_ids), dtype=bool)
+        frontier = np.array([self.node_index[main_id]])
+        visited[frontier] = True
+        reached = []
+        for _ in range(hops):
+            parts = []
+            if direction in ('both', 'out'):
+                parts.append(csr_gather(self.out_indptr, self.out_indices, frontier))
+            if direction in ('both', 'in'):
+                parts.append(csr_gather(self.in_indptr, self.in_indices, frontier))
+            candidates = np.concatenate(parts)
+            frontier = np.unique(candidates[~visited[candidates]])
+            if len(frontier) == 0:
+                break
+            visited[frontier] = True
+            reached.append(frontier)
+
+        rows = np.concatenate(reached) if reached else np.array([], dtype=np.int64)
+
+        # Hubs reach a large part of the graph within a few hops; keep only the most important figures
+        if len(rows) > limit:
+            rows = rows[np.argpartition(-self.node_scores[rows], limit - 1)[:limit]]
+
+        return tuple(self.node_ids[rows].tolist())
+
+    def get_influence_related(self, main_id, top_k=INFLUENCE_TOP_K):
+        if main_id not in self.node_index:
+            return []
+        return list(self.cached_personalized_pagerank(main_id, top_k))
+
+    def calculate_personalized_pagerank(self, main_id, top_k, damping=0.85, tol=1e-8, max_iter=100):
+        seed = self.node_index[main_id]
+        n = len(self.node_ids)
+        out_degree = np.diff(self.out_indptr)
+        inv_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=out_degree > 0)
+
+        # Power iteration where every random jump (and every dead end) returns to the seed figure
+        scores = np.zeros(n)
+        scores[seed] = 1.0
+        for _ in range(max_iter):
+            # Sparse matrix-vector product: push each row's score along its outgoing links
+            new_scores = damping * np.bincount(self.out_indices, weights=np.repeat(scores * inv_degree, out_degree), minlength=n)
+            new_scores[seed] += 1.0 - new_scores.sum()
+            delta = np.abs(new_scores - scores).sum()
+            scores = new_scores
+            if delta < tol:
+                break
+
+        # Top-K figures by score, excluding the seed itself
+        scores[seed] = 0.0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return tuple(self.node_ids[candidates].tolist())
+
+    def get_shortest_path(self, source_id, target_id, max_nodes=PATH_NODE_BUDGET):
+        if source_id not in self.node_index or target_id not in self.node_index:
+            return None
+        path = self.cached_shortest_path(source_id, target_id, max_nodes)
+        return list(path) if path is not None else None
+
+    def calculate_shortest_path(self, source_id, target_id, max_nodes):
+        source, target = self.node_index[source_id], self.node_index[target_id]
+        if source == target:
+            return (source_id,)
+
+        # Bidirectional BFS: forward along outgoing links from the source, backward along
+        # incoming links from the target, always expanding the smaller frontier by a full level
+        n = len(self.node_ids)
+        sides = {
+            'forward': {'parent': np.full(n, -1), 'dist': np.full(n, -1), 'frontier': np.array([source]),
+                        'indptr': self.out_indptr, 'indices': self.out_indices},
+            'backward': {'parent': np.full(n, -1), 'dist': np.full(n, -1), 'frontier': np.array([target]),
+                         'indptr': self.in_indptr, 'indices': self.in_indices},
+        }
+        sides['forward']['dist'][source] = 0
+        sides['backward']['dist'][target] = 0
+        visited_count = 2
+
+        while len(sides['forward']['frontier']) and len(sides['backward']['frontier']):
+            name = 'forward' if len(sides['forward']['frontier']) <= len(sides['backward']['frontier']) else 'backward'
+            side, other = sides[name], sides['backward' if name == 'forward' else 'forward']
+
+            # Expand the whole frontier at once, remembering which row each neighbor came from
+            frontier = side['frontier']
+            lengths = side['indptr'][frontier + 1] - side['indptr'][frontier]
+            neighbors = csr_gather(side['indptr'], side['indices'], frontier)
+            parents = np.repeat(frontier, lengths)
+            new = side['dist'][neighbors] < 0
+            neighbors, first = np.unique(neighbors[new], return_index=True)
+            side['parent'][neighbors] = parents[new][first]
+            side['dist'][neighbors] = side['dist'][frontier[0]] + 1
+            side['frontier'] = neighbors
+
+            # The searches meet: join at the meeting row closest to the other end
+            met = neighbors[other['dist'][neighbors] >= 0]
+            if len(met):
+                meeting = met[np.argmin(other['dist'][met])]
+                return tuple(self.node_ids[self.trace_path(sides, meeting)].tolist())
+
+            visited_count += len(neighbors)
+            if visited_count > max_nodes:
+                return None  # Give up rather than exceed the per-request budget
+
+        return None
+
+    def trace_path(self, sides, meeting):
+        # Walk the parent pointers back to the source and forward to the target
+        path = [meeting]
+        while sides['forward']['parent'][path[0]] >= 0:
+            path.insert(0, sides['forward']['parent'][path[0]])
+        while sides['backward']['parent'][path[-1]] >= 0:
+            path.append(sides['backward']['parent'][path[-1]])
+        return path
+
+    def get_cluster_members(self, main_id):
+        if self.clusters is None:
+            self.load_or_calculate_clusters()
+        if main_id not in self.clusters:
             return []  # Return empty list if main_id is not in any cluster
-        main_cluster = self.clusters[self.main_id]
+        main_cluster = self.clusters[main_id]
         return [node for node, cluster in self.clusters.items() if cluster == main_cluster]
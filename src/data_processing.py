@@ -2,15 +2,32 @@ import psycopg2
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-import pandas as pd
 import ast
+import functools
+import threading
 import time
+import numpy as np
+from figure_table import FigureTable, NO_YEAR
 
 load_dotenv()
 
 # Global variable to store the database connection
 db_conn = None
 
+# Whether the per-occupation ranking table (built by TopicPageRank.py) is loaded
+has_occupation_ranks = None
+
+# Version of the loaded data, and when it was last checked
+data_version = None
+data_version_checked = 0
+DATA_VERSION_TTL = 30  # Seconds between checks
+
+RANGE_LIMIT = 2000  # Most figures shown for a range of years
+
+# Table of all figures (see figure_table.py), shared by the threads of the process
+figure_table = None
+figure_table_lock = threading.Lock()
+
 # Function to establish the database connection
 # data_processing.py
 
@@ -19,197 +36,163 @@ def connect_db():
     if db_conn is None or db_conn.closed != 0:
         DATABASE_URL = os.getenv('DATABASE_URL')
         db_conn = psycopg2.connect(DATABASE_URL)
+        # No transaction is left open between queries, so a table swap by
+        # load_to_postgres.py never waits for an idle app
+        db_conn.autocommit = True
     else:
         # Reset the connection if it's in an error state
         db_conn.rollback()
     return db_conn
 
-# Fetch unique occupations from the database
+# Check once whether the per-occupation ranking table exists
+def occupation_ranks_available():
+    global has_occupation_ranks
+    if has_occupation_ranks is None:
+        conn = connect_db()
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('public.occupation_ranks') IS NOT NULL;")
+        has_occupation_ranks = cur.fetchone()[0]
+        cur.close()
+    return has_occupation_ranks
+
+# Version of the data in the database: load_to_postgres.py swaps in new tables, which
+# get new OIDs, so the OIDs identify the load. Checked at most every DATA_VERSION_TTL seconds.
+def get_data_version():
+    global data_version, data_version_checked, has_occupation_ranks
+    if data_version is None or time.time() - data_version_checked > DATA_VERSION_TTL:
+        conn = connect_db()
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('public.top_figures')::oid, to_regclass('public.occupation_ranks')::oid;")
+        version = '-'.join(str(oid or 0) for oid in cur.fetchone())
+        cur.close()
+        if version != data_version:
+            has_occupation_ranks = None  # The ranking table may have been added or dropped
+        data_version = version
+        data_version_checked = time.time()
+    return data_version
+
+# Process-wide table of every figure, loaded once and again when the data version changes
+def get_figure_table():
+    global figure_table
+    version = get_data_version()
+    if figure_table is None or figure_table.version != version:
+        with figure_table_lock:
+            if figure_table is None or figure_table.version != version:
+                figure_table = FigureTable.load(connect_db, occupation_ranks_available(), version)
+    return figure_table
+
+# Page IDs of the related figures ("[1, 2, 3]"), or None when there is no selection
+def parse_filtered_links(filtered_links):
+    if filtered_links and filtered_links != "None":
+        return ast.literal_eval(filtered_links)
+    return None
+
+# Fetch unique occupations, the most common first
 def get_unique_occupations():
-    conn = connect_db()
-    cur = conn.cursor()
-
-    # Use jsonb_array_elements_text to extract each occupation and count occurrences
-    query = """
-    SELECT occupation, COUNT(*) as count
-    FROM (
-        SELECT jsonb_array_elements_text(occupation) AS occupation
-        FROM public.top_figures
-    ) sub
-    WHERE occupation IS NOT NULL
-    GROUP BY occupation
-    ORDER BY count DESC;
-    """
-
-    cur.execute(query)
-    occupations_counts = cur.fetchall()
-    cur.close()
-
-    # Extract occupations from the query result
-    occupations = [row[0] for row in occupations_counts]
+    table = get_figure_table()
 
     # Add "All" at the top of the list
-    occupations.insert(0, "All")
-
-    return occupations
+    return ["All"] + list(table.occupation_pool)
 
-# Fetch the minimum birth year from the database
+# Fetch the minimum birth year
 def get_min_year():
-    conn = connect_db()
-    cur = conn.cursor()
-
-    query = """
-    SELECT MIN(birth) AS min_year 
-    FROM public.top_figures 
-    WHERE birth IS NOT NULL;
-    """
-
-    cur.execute(query)
-    min_year = cur.fetchone()[0]
-    cur.close()
-
-    return min_year
+    table = get_figure_table()
+    births = table.birth[table.birth != NO_YEAR]
+    return int(births.min()) if len(births) else None
 
 # Fetch the maximum year as the current year
 def get_max_year():
     return datetime.now().year
 
+# Number of figures alive in every year from min_year to max_year (alive as in
+# get_figures_for_year), from a difference array over births and deaths
+# (data_version only keys the cache)
+@functools.lru_cache(maxsize=128)
+def get_alive_counts(selected_occupation, min_year, max_year, data_version=None):
+    table = get_figure_table()
+    mask = table.filter_rows((table.birth != NO_YEAR) & (table.birth <= max_year), selected_occupation, None)
+
+    births = table.birth[mask].astype(np.int64)
+    deaths = table.death[mask].astype(np.int64)
+    # A death before the birth means never alive; still alive means alive until max_year
+    never_alive = deaths < births
+    births = births[~never_alive] - min_year
+    ends = np.minimum(deaths[~never_alive], max_year) - min_year + 1
+
+    # +1 in the year of birth, -1 in the year after death; the running sum is the count alive
+    span = max_year - min_year + 1
+    changes = np.bincount(np.clip(births, 0, span), minlength=span + 1)
+    changes -= np.bincount(np.clip(ends, 0, span), minlength=span + 1)
+    return np.cumsum(changes[:span])
+
 # Fetch figures for a given year, occupation, and filtered links
 # data_processing.py
 
-def get_figures_for_year(selected_year, selected_occupation, filtered_links):
-    conn = connect_db()
-    cur = conn.cursor()
-    
-    # Base query
-    query = """
-    SELECT
-        page_id,
-        article_name,
-        birth,
-        death,
-        latitude,
-        longitude,
-        color_value,
-        occupation
-    FROM public.top_figures
-    WHERE birth <= %s AND (death >= %s OR death IS NULL OR death = 0)
-    """
-    params = [selected_year, selected_year]
-    
-    # Apply occupation filter if not "All"
-    if selected_occupation != "All":
-        query += " AND EXISTS (SELECT 1 FROM jsonb_array_elements_text(occupation) AS occ WHERE LOWER(occ) = LOWER(%s))"
-        params.append(selected_occupation)
-    
-    # Apply filtered links if provided
-    if filtered_links and filtered_links != "None":
-        page_ids = ast.literal_eval(filtered_links)
-        if len(page_ids) > 0:
-            placeholders = ', '.join(['%s'] * len(page_ids))
-            query += f" AND page_id IN ({placeholders})"
-            params.extend(page_ids)
-        else:
-            # If page_ids is empty, no figures should be returned
-            query += " AND FALSE"
-    
-    # Execute the query
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    cur.close()
-    
-    # Convert to DataFrame
-    df_filtered = pd.DataFrame(rows, columns=[
-        'page_id',
-        'article_name',
-        'birth',
-        'death',
-        'latitude',
-        'longitude',
-        'color_value',
-        'occupation'
-    ])
-    
-    return df_filtered
+def get_figures_for_year(selected_year, selected_occupation, filtered_links, table=None):
+    # (table: an already loaded FigureTable, for callers off the request threads)
+    if table is None:
+        table = get_figure_table()
+    # Alive in the year: born by then, and not dead before it (or still alive)
+    mask = (table.birth <= selected_year) & (table.death >= selected_year)
+    mask = table.filter_rows(mask, selected_occupation, parse_filtered_links(filtered_links))
+    return table.frame(np.flatnonzero(mask), table.colors(selected_occupation))
+
+# Fetch the most important figures alive at any point between two years (their lifespan
+# overlaps the range)
+def get_figures_for_range(start_year, end_year, selected_occupation, filtered_links, limit=RANGE_LIMIT):
+    table = get_figure_table()
+    # Candidates from the table's lifespan index, without a pass over every row
+    rows = table.rows_alive_between(start_year, end_year)
+    rows = rows[table.filter_rows(np.ones(len(rows), dtype=bool), selected_occupation,
+                                  parse_filtered_links(filtered_links), rows)]
+
+    # Rows are in order of importance; within an occupation, rank by its own colors instead
+    colors = table.colors(selected_occupation)
+    if colors is not table.color:
+        rows = rows[np.argsort(-np.nan_to_num(colors[rows], nan=-np.inf), kind='stable')]
+    return table.frame(rows[:limit], colors)
+
+# Fetch every figure of an occupation with its lifespan, for timeline playback
+# (colored like get_figures_for_year)
+def get_timeline_figures(selected_occupation):
+    table = get_figure_table()
+    mask = table.filter_rows(table.birth != NO_YEAR, selected_occupation, None)
+    return table.frame(np.flatnonzero(mask), table.colors(selected_occupation))
 
 # Fetch detailed data for a specific figure by article name
 def get_figure_data(article_name):
-    conn = connect_db()
-    cur = conn.cursor()
-
-    query = """
-    SELECT page_id,
-           article_name,
-           description,
-           wikipedia_link,
-           rank
-    FROM (
-        SELECT
-            page_id,
-            article_name,
-            description,
-            wikipedia_link,
-            ROW_NUMBER() OVER (ORDER BY pagerank_score DESC) AS rank
-        FROM public.top_figures
-    ) sub
-    WHERE article_name = %s
-    """
-    params = [article_name]
-
-    cur.execute(query, params)
-    row = cur.fetchone()
-    cur.close()
-
-    if row:
-        figure_data = {
-            'page_id': row[0],
-            'article_name': row[1],
-            'description': row[2],
-            'wikipedia_link': row[3],
-            'rank': row[4]
-        }
-        return figure_data
-    else:
+    table = get_figure_table()
+    row = table.row_of_name(article_name)
+    if row is None:
         return None
 
-# Fetch all article names from the database
-def get_all_article_names():
-    conn = connect_db()
-    cur = conn.cursor()
-
-    # If you want to rank by pagerank_score, you can do this:
-    query = """
-    SELECT article_name
-    FROM public.top_figures
-    ORDER BY pagerank_score DESC;  -- Ordering by pagerank_score instead of rank
-    """
+    description, wikipedia_link = table.text(row)
+    return {
+        'page_id': int(table.page_id[row]),
+        'article_name': article_name,
+        'description': description,
+        'wikipedia_link': wikipedia_link,
+        'rank': row + 1  # Rows are in order of pagerank_score
+    }
 
-    cur.execute(query)
-    article_names = [row[0] for row in cur.fetchall()]
-    cur.close()
+# Fetch all article names, ranked by pagerank_score
+def get_all_article_names():
+    return get_figure_table().all_names()
 
-    return article_names
+# Fetch names and coordinates of the given figures, in the order of page_ids
+def get_figures_by_ids(page_ids, table=None):
+    if table is None:
+        table = get_figure_table()
+    rows = table.rows_of_ids(list(page_ids))
+    return table.frame(rows[rows >= 0], columns=('page_id', 'article_name', 'latitude', 'longitude'))
 
 # Fetch the birth year of a figure by article name
 def get_birth_year(article_name):
-    conn = connect_db()
-    cur = conn.cursor()
-    
-    query = """
-    SELECT birth
-    FROM public.top_figures
-    WHERE article_name = %s
-    """
-    params = [article_name]
-    
-    cur.execute(query, params)
-    result = cur.fetchone()
-    cur.close()
-    
-    if result:
-        return result[0]
-    else:
+    table = get_figure_table()
+    row = table.row_of_name(article_name)
+    if row is None or table.birth[row] == NO_YEAR:
         return None
+    return int(table.birth[row])
 
 # Function to close the database connection when the app shuts down
 def close_db_connection():
@@ -0,0 +1,221 @@
+import bisect
+import functools
+import io
+import json
+import numpy as np
+import pandas as pd
+
+# Every figure of public.top_figures held once per process as contiguous NumPy columns, in
+# rank order (row 0 is the most important figure), so the app's lookups are positional
+# indexing into arrays instead of per-row Python tuples and object columns. Names are one
+# UTF-8 blob with offsets, occupations are codes into a pool of distinct strings, and the
+# long text fields (description, Wikipedia link) are only fetched by row when needed.
+NO_YEAR = np.iinfo(np.int32).max  # Unknown birth (never shown) or no death (still alive)
+TEXT_CACHE_SIZE = 4096
+MASK_CACHE_SIZE = 64
+
+
+class FigureTable:
+    def __init__(self, connect, version=None):
+        self.connect = connect
+        self.version = version
+        self.cached_occupation_mask = functools.lru_cache(maxsize=MASK_CACHE_SIZE)(self.calculate_occupation_mask)
+        self.cached_occupation_colors = functools.lru_cache(maxsize=MASK_CACHE_SIZE)(self.calculate_occupation_colors)
+        self.cached_text = functools.lru_cache(maxsize=TEXT_CACHE_SIZE)(self.fetch_text)
+
+    @classmethod
+    def load(cls, connect, with_occupation_ranks, version=None):
+        table = cls(connect, version)
+        conn = connect()
+        cur = conn.cursor()
+
+        # One COPY of the short columns, parsed straight into typed arrays
+        buffer = io.BytesIO()
+        cur.copy_expert("""
+            COPY (SELECT page_id, birth, death, latitude, longitude, color_value, article_name, occupation
+                  FROM public.top_figures ORDER BY pagerank_score DESC) TO STDOUT WITH (FORMAT csv)
+        """, buffer)
+        buffer.seek(0)
+        df = pd.read_csv(buffer, header=None, keep_default_na=False, na_values=[''],
+                         names=['page_id', 'birth', 'death', 'latitude', 'longitude', 'color_value', 'article_name', 'occupation'],
+                         dtype={'article_name': str, 'occupation': str})
+        del buffer
+
+        table.page_id = df['page_id'].to_numpy(dtype=np.int64)
+        table.id_order = np.argsort(table.page_id, kind='stable')
+        table.birth = df['birth'].fillna(NO_YEAR).to_numpy(dtype=np.int32)
+        # A death of NULL or 0 means still alive (as in the SQL queries it replaces)
+        table.death = df['death'].fillna(0).replace(0, NO_YEAR).to_numpy(dtype=np.int32)
+        table.death_recorded = df['death'].notna().to_numpy()  # 0 rather than NULL in the frames
+        table.build_lifespan_index()
+        table.latitude = df['latitude'].to_numpy(dtype=np.float32)
+        table.longitude = df['longitude'].to_numpy(dtype=np.float32)
+        table.color = df['color_value'].to_numpy(dtype=np.float32)
+
+        names = df['article_name'].fillna('').tolist()
+        table.name_order = np.argsort(np.array(names, dtype=object), kind='stable').astype(np.int32)
+        table.set_names(names)
+
+        # Occupation codes of every row (CSR), into a pool ordered by how common they are
+        occupation_lists = [json.loads(value) if isinstance(value, str) else [] for value in df['occupation']]
+        del df
+        flat = pd.Series([value for values in occupation_lists for value in values if value is not None], dtype=object)
+        counts = np.array([sum(value is not None for value in values) for values in occupation_lists], dtype=np.int64)
+        codes, pool = pd.factorize(flat)
+        frequency = np.bincount(codes, minlength=len(pool))
+        by_frequency = np.argsort(-frequency, kind='stable')
+        recode = np.empty_like(by_frequency)
+        recode[by_frequency] = np.arange(len(pool))
+        table.occupation_pool = [pool[i] for i in by_frequency]
+        table.occupation_counts = frequency[by_frequency]
+        table.occupation_codes = recode[codes].astype(np.int32)
+        table.occupation_offsets = np.zeros(len(table.page_id) + 1, dtype=np.int64)
+        np.cumsum(counts, out=table.occupation_offsets[1:])
+
+        # Colors of the per-occupation rankings (TopicPageRank.py), grouped by occupation
+        table.rank_occupations, table.rank_offsets = [], np.zeros(1, dtype=np.int64)
+        table.rank_rows, table.rank_colors = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        if with_occupation_ranks:
+            cur.execute("SELECT LOWER(occupation), page_id, color_value FROM public.occupation_ranks")
+            rows = cur.fetchall()
+            if rows:
+                occupations, page_ids, colors = zip(*rows)
+                # Sorted here rather than in SQL, so the order is the one bisect compares with
+                order = np.argsort(np.array(occupations, dtype=object), kind='stable')
+                rows = table.rows_of_ids(np.array(page_ids, dtype=np.int64)[order])
+                found = rows >= 0
+                occupations = np.array(occupations, dtype=object)[order][found]
+                colors = np.array(colors, dtype=np.float32)[order]
+                starts = np.flatnonzero(np.r_[True, occupations[1:] != occupations[:-1]]) if len(occupations) else np.zeros(0, dtype=np.int64)
+                table.rank_occupations = occupations[starts].tolist()
+                table.rank_offsets = np.append(starts, len(occupations)).astype(np.int64)
+                table.rank_rows = rows[found].astype(np.int32)
+                table.rank_colors = colors[found]
+        cur.close()
+        return table
+
+    def build_lifespan_index(self):
+        # Interval index for range queries: the rows with a known birth ordered by birth, the
+        # last year each one is alive, and the running maximum of that year. The rows born by
+        # the end of a range are a prefix of the order, and the running maximum (which only
+        # grows) tells how much of that prefix died before the range starts
+        known = np.flatnonzero(self.birth != NO_YEAR)
+        self.birth_order = known[np.argsort(self.birth[known], kind='stable')].astype(np.int32)
+        self.sorted_birth = self.birth[self.birth_order]
+        self.sorted_last_alive = np.maximum(self.death, self.birth)[self.birth_order]
+        self.max_last_alive = np.maximum.accumulate(self.sorted_last_alive)
+
+    def rows_alive_between(self, start_year, end_year):
+        # Rows whose lifespan overlaps the range, in rank order; two binary searches narrow
+        # the candidates to the figures born before the end and after the last one to die
+        # before the start
+        # (the years as int32 like the arrays: a Python int makes NumPy convert the whole array)
+        first = np.searchsorted(self.max_last_alive, np.int32(start_year), side='left')
+        last = np.searchsorted(self.sorted_birth, np.int32(end_year), side='right')
+        if first >= last:
+            return np.zeros(0, dtype=np.int64)
+        overlapping = self.sorted_last_alive[first:last] >= start_year
+        return np.sort(self.birth_order[first:last][overlapping]).astype(np.int64)
+
+    def set_names(self, names):
+        encoded = [name.encode('utf-8') for name in names]
+        self.name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=self.name_offsets[1:])
+        self.names = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.page_id)
+
+    def name(self, row):
+        return self.names[self.name_offsets[row]:self.name_offsets[row + 1]].tobytes().decode('utf-8')
+
+    def all_names(self):
+        return [self.name(row) for row in range(len(self))]
+
+    def row_of_name(self, name):
+        # Binary search over the rows in name order, decoding only the names it compares
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.name(self.name_order[middle]) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self.name(self.name_order[low]) == name:
+            return int(self.name_order[low])
+        return None
+
+    def rows_of_ids(self, page_ids):
+        # Row of every page ID, or -1 for IDs that are not in the table
+        page_ids = np.asarray(page_ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(len(page_ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.page_id, page_ids, sorter=self.id_order), len(self) - 1)
+        rows = self.id_order[positions]
+        return np.where(self.page_id[rows] == page_ids, rows, -1)
+
+    def occupations(self, row):
+        codes = self.occupation_codes[self.occupation_offsets[row]:self.occupation_offsets[row + 1]]
+        return [self.occupation_pool[code] for code in codes]
+
+    def calculate_occupation_mask(self, occupation):
+        # Rows listing the occupation, compared case-insensitively (as the SQL filter did)
+        target = occupation.lower()
+        codes = [code for code, name in enumerate(self.occupation_pool) if name.lower() == target]
+        matches = np.isin(self.occupation_codes, codes)
+        owners = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.occupation_offsets))
+        return np.bincount(owners[matches], minlength=len(self)) > 0
+
+    def calculate_occupation_colors(self, occupation):
+        # The occupation's own ranking where it has one, the global one otherwise
+        colors = self.color.copy()
+        i = bisect.bisect_left(self.rank_occupations, occupation.lower())
+        if i < len(self.rank_occupations) and self.rank_occupations[i] == occupation.lower():
+            start, end = self.rank_offsets[i], self.rank_offsets[i + 1]
+            colors[self.rank_rows[start:end]] = self.rank_colors[start:end]
+        return colors
+
+    def filter_rows(self, mask, selected_occupation, filtered_links, rows=None):
+        # Narrow a mask of rows to an occupation and a set of page IDs (as in the app's inputs);
+        # the mask covers every row, or only the given rows
+        if selected_occupation != "All":
+            occupation_mask = self.cached_occupation_mask(selected_occupation)
+            mask &= occupation_mask if rows is None else occupation_mask[rows]
+        if filtered_links is not None:
+            allowed = np.zeros(len(self), dtype=bool)
+            linked = self.rows_of_ids(filtered_links)
+            allowed[linked[linked >= 0]] = True
+            mask &= allowed if rows is None else allowed[rows]
+        return mask
+
+    def colors(self, selected_occupation):
+        if selected_occupation != "All" and len(self.rank_rows):
+            return self.cached_occupation_colors(selected_occupation)
+        return self.color
+
+    def frame(self, rows, colors=None, columns=('page_id', 'article_name', 'birth', 'death', 'latitude', 'longitude', 'color_value')):
+        # DataFrame of the given rows, with the columns (and missing values) of the old SQL queries
+        rows = np.asarray(rows, dtype=np.int64)
+        values = {
+            'page_id': lambda: self.page_id[rows],
+            'article_name': lambda: [self.name(row) for row in rows],
+            'birth': lambda: self.birth[rows],
+            'death': lambda: [(0 if death == NO_YEAR else death) if recorded else None
+                              for death, recorded in zip(self.death[rows].tolist(), self.death_recorded[rows].tolist())],
+            'latitude': lambda: self.latitude[rows].astype(float),
+            'longitude': lambda: self.longitude[rows].astype(float),
+            'color_value': lambda: (self.color if colors is None else colors)[rows].astype(float),
+        }
+        return pd.DataFrame({column: values[column]() for column in columns})
+
+    def fetch_text(self, page_id):
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.execute("SELECT description, wikipedia_link FROM public.top_figures WHERE page_id = %s", [page_id])
+        row = cur.fetchone()
+        cur.close()
+        return row if row else (None, None)
+
+    def text(self, row):
+        # Description and Wikipedia link of a row, loaded on first use
+        return self.cached_text(int(self.page_id[row]))
@@ -3,6 +3,7 @@
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 import math
+import numpy as np
 import plotly.graph_objects as go
 
 def map_to_year(x: float, min_year: int, max_year: int) -> int:
@@ -11,7 +12,41 @@ def map_to_year(x: float, min_year: int, max_year: int) -> int:
     scaled_x = math.pow(x, 0.2)
     return int(float(min_year) + scaled_x * (float(max_year) - float(min_year)))
 
-def create_app_layout(unique_occupations, min_year, max_year):
+def year_to_slider(year: int, min_year: int, max_year: int) -> float:
+    # Smallest slider value that map_to_year maps to `year` (the inverse of its x ** 0.2)
+    x = math.pow((year - min_year) / (max_year - min_year), 5)
+    while x < 1 and map_to_year(x, min_year, max_year) < year:
+        x = min(math.nextafter(x, 2), 1.0)
+    return x
+
+# Density of figures alive per year, drawn in slider coordinates so that every point sits
+# above the slider position that shows that year (the slider is not linear in years)
+def create_alive_sparkline(alive_counts, min_year, max_year, slider_steps=1000):
+    positions = np.linspace(0, 1, slider_steps + 1)
+    years = (min_year + np.power(positions, 0.2) * (max_year - min_year)).astype(int)
+    counts = alive_counts[years - min_year]
+
+    fig = go.Figure(go.Scatter(
+        x=positions,
+        y=counts,
+        customdata=years,
+        mode='lines',
+        fill='tozeroy',
+        line=dict(width=1, color="#5DADE2"),
+        hovertemplate="%{customdata}: %{y} alive<extra></extra>",
+    ))
+    fig.update_layout(
+        margin=dict(l=25, r=25, t=0, b=0),  # Match the slider's horizontal padding
+        xaxis=dict(visible=False, range=[0, 1], fixedrange=True),
+        yaxis=dict(visible=False, fixedrange=True),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        showlegend=False,
+        hovermode='x',
+    )
+    return fig
+
+def create_app_layout(unique_occupations, min_year, max_year, article_names):
     common_styles = {
         'fontFamily': '"Montserrat", sans-serif',
         'color': '#333',
@@ -69,7 +104,10 @@ def create_app_layout(unique_occupations, min_year, max_year):
                     id='group-dropdown',
                     options=[
                         {'label': 'Share Wikipedia Links', 'value': 'neighbors'},
-                        {'label': 'Same Cluster', 'value': 'louvain'}
+                        {'label': 'Same Cluster', 'value': 'louvain'},
+                        {'label': 'Within 2 Links', 'value': 'hops_2'},
+                        {'label': 'Within 3 Links', 'value': 'hops_3'},
+                        {'label': 'Influence', 'value': 'influence'}
                     ],
                     value='neighbors',
                     placeholder="Select a group option",
@@ -77,6 +115,21 @@ def create_app_layout(unique_occupations, min_year, max_year):
                     className='dropdown'
                 )
             ], xs=4, sm=3, md=3, lg=3),
+            dbc.Col([
+                html.Label("Link direction:", className="label", style={'fontWeight': 'bold'}),
+                dcc.Dropdown(
+                    id='direction-dropdown',
+                    options=[
+                        {'label': 'Both Ways', 'value': 'both'},
+                        {'label': 'Links From Figure', 'value': 'out'},
+                        {'label': 'Links To Figure', 'value': 'in'}
+                    ],
+                    value='both',
+                    placeholder="Select a link direction",
+                    clearable=False,
+                    className='dropdown'
+                )
+            ], xs=4, sm=3, md=3, lg=3),
             dbc.Col([
                 html.Label("select", className="label", style={'fontWeight': 'bold', 'visibility': 'hidden'}),  # add invisible label to match dropdowns
                 html.Button(
@@ -162,20 +215,78 @@ def create_app_layout(unique_occupations, min_year, max_year):
         # Slider Row
         dbc.Row([
             dbc.Col([
-                dcc.Slider(
-                    id='year-slider',
-                    min=0,
-                    max=1,
-                    value=1,
-                    step=0.001,
-                    marks={x: str(map_to_year(x, min_year, max_year)) for x in [i / 12 for i in range(12)] + [1]},
-                    className="slider",
-                    updatemode='drag'
+                # Filled in by update_alive_sparkline; clicking it moves the slider to that year
+                dcc.Graph(
+                    id='alive-sparkline',
+                    figure=go.Figure(layout=dict(
+                        margin=dict(l=0, r=0, t=0, b=0),
+                        xaxis=dict(visible=False),
+                        yaxis=dict(visible=False),
+                        plot_bgcolor='rgba(0,0,0,0)',
+                        paper_bgcolor='rgba(0,0,0,0)',
+                    )),
+                    config={'displayModeBar': False},
+                    style={'height': '50px'}
                 ),
+                html.Div([
+                    dcc.Slider(
+                        id='year-slider',
+                        min=0,
+                        max=1,
+                        value=1,
+                        step=0.001,
+                        marks={x: str(map_to_year(x, min_year, max_year)) for x in [i / 12 for i in range(12)] + [1]},
+                        className="slider",
+                        updatemode='drag'
+                    ),
+                ], id='year-slider-wrapper'),
+                # Range of years, shown instead of the year slider in range mode; range queries
+                # are heavier, so they run once the handle is released
+                html.Div([
+                    dcc.RangeSlider(
+                        id='year-range-slider',
+                        min=0,
+                        max=1,
+                        value=[0.85, 0.9],
+                        step=0.001,
+                        marks={x: str(map_to_year(x, min_year, max_year)) for x in [i / 12 for i in range(12)] + [1]},
+                        className="slider",
+                        updatemode='mouseup'
+                    ),
+                ], id='year-range-wrapper', style={'display': 'none'}),
             ], width=12, className="slider-container", style={'marginTop': '20px'}),
         ]),
+        # Timeline playback controls
+        dbc.Row([
+            dbc.Col([
+                html.Button('Play', id='play-button', style=button_style),
+            ], xs=4, sm=3, md=2, lg=2),
+            dbc.Col([
+                dcc.Dropdown(
+                    id='playback-step',
+                    options=[{'label': f'{step} year{"s" if step > 1 else ""} per frame', 'value': step}
+                             for step in [1, 5, 10, 25, 50]],
+                    value=10,
+                    clearable=False,
+                    className='dropdown'
+                )
+            ], xs=6, sm=4, md=3, lg=3),
+            dbc.Col([
+                dcc.Checklist(
+                    id='range-mode',
+                    options=[{'label': ' Range of years', 'value': 'range'}],
+                    value=[],
+                    className='label'
+                )
+            ], xs=6, sm=4, md=3, lg=2),
+        ], justify="center", align="center", className="mb-2"),
+        dcc.Interval(id='playback-interval', interval=150, disabled=True),
+        dcc.Store(id='playback-frames'),
+        dcc.Store(id='playback-year'),
         # Hidden Divs
         html.Div(id='filtered-links', style={'display': 'none'}),
+        dcc.Store(id='related-request'),  # Selected figure and group option, for the background search
+        html.Div(id='connection-path', style={'display': 'none'}),
         html.Div(id='current-selection', style={'display': 'none'}),
         # Info Row
         dbc.Row([
@@ -207,6 +318,30 @@ def create_app_layout(unique_occupations, min_year, max_year):
                         'fontSize': '16px',
                         'textAlign': 'center',
                     }
+                ),
+                # Progress of the background search for related figures, shown while it runs
+                html.Div([
+                    html.Span(id='related-status', style={'marginRight': '10px'}),
+                    html.Progress(id='related-progress', value='0', max='1', style={'width': '200px', 'marginRight': '10px'}),
+                    html.Button('Cancel', id='cancel-related-button', style={**button_style, 'padding': '5px 10px'}),
+                ], id='related-job', style={'display': 'none'}),
+                html.Label("Connect to:", className="label", style={'fontWeight': 'bold', 'marginTop': '10px'}),
+                dcc.Dropdown(
+                    id='connect-dropdown',
+                    options=[{'label': name, 'value': name} for name in article_names],
+                    placeholder="Select a figure to find the chain of links",
+                    className='dropdown',
+                    style={'width': '300px'}
+                ),
+                html.Div(
+                    id='connection-display',
+                    className="description-display",
+                    style={
+                        'fontFamily': '"Montserrat", sans-serif',
+                        'fontSize': '14px',
+                        'textAlign': 'center',
+                        'marginTop': '5px',
+                    }
                 )
             ], width=12, className="info-container", style={
                 'display': 'flex',
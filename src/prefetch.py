@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+# Speculative prefetch of the years next to the one just shown. Users scrub the slider in
+# small steps, so after year Y is served for a context (occupation, related figures,
+# connection path), the years of the next few slider steps on both sides are computed into
+# the shared cache by a background thread, while the worker has no request to serve.
+# Scheduling new years for a context cancels what was still pending for it, so only the
+# neighborhood of where the user is now gets warmed. Whatever the years are computed from
+# (the data and its version) is captured by the request that schedules them and handed to
+# compute, so the thread shares no connection or global state with the requests.
+PREFETCH_RADIUS = int(os.environ.get('PREFETCH_RADIUS', 3))  # Slider steps on each side
+PREFETCH_CONTEXTS = 16  # Contexts (roughly, users) with pending years, per worker
+IDLE_DELAY = 0.2  # Seconds without a request before the worker counts as idle
+
+
+class Prefetcher:
+    def __init__(self, compute):
+        # compute(context, year, data) fills the cache for one year; it is only called when idle
+        self.compute = compute
+        self.condition = threading.Condition()
+        self.pending = OrderedDict()  # context -> (years still to prefetch, nearest first; data)
+        self.positions = OrderedDict()  # context -> last slider value served
+        self.active = 0
+        self.last_request = 0.0
+        self.thread = None
+
+    def request_started(self):
+        with self.condition:
+            self.active += 1
+
+    def request_finished(self):
+        with self.condition:
+            self.active -= 1
+            self.last_request = time.monotonic()
+            self.condition.notify()
+
+    def move(self, context, slider_value):
+        # Records where the slider is for this context, and returns where it was before
+        with self.condition:
+            previous_value = self.positions.pop(context, None)
+            self.positions[context] = slider_value
+            while len(self.positions) > PREFETCH_CONTEXTS:
+                self.positions.popitem(last=False)
+            return previous_value
+
+    def schedule(self, context, years, data=None):
+        with self.condition:
+            # Replaces (cancels) the years still pending for this context
+            self.pending.pop(context, None)
+            if years:
+                self.pending[context] = (list(years), data)
+                while len(self.pending) > PREFETCH_CONTEXTS:
+                    self.pending.popitem(last=False)
+            if self.thread is None:
+                # Started on first use, so it belongs to the worker process, not a preloading parent
+                self.thread = threading.Thread(target=self.run, name='prefetch', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def next_task(self):
+        # Blocks until the worker is idle and a year is pending; most recent context first
+        with self.condition:
+            while True:
+                idle_for = time.monotonic() - self.last_request
+                if self.pending and self.active == 0 and idle_for >= IDLE_DELAY:
+                    context, (years, data) = next(reversed(self.pending.items()))
+                    year = years.pop(0)
+                    if not years:
+                        del self.pending[context]
+                    return context, year, data
+                self.condition.wait(None if not self.pending else max(IDLE_DELAY - idle_for, 0.01))
+
+    def run(self):
+        while True:
+            context, year, data = self.next_task()
+            try:
+                self.compute(context, year, data)
+            except Exception:
+                # A failed guess costs nothing; the request for that year computes it again
+                print(f"Prefetch of {year} failed:")
+                traceback.print_exc()
+
+
+def neighbor_years(slider_value, previous_value, to_year, step=0.001, radius=PREFETCH_RADIUS):
+    # Years of the next `radius` slider steps on each side, nearest first and in the
+    # direction the slider was last moved first
+    year = to_year(slider_value)
+    direction = -1 if previous_value is not None and previous_value > slider_value else 1
+    years = []
+    for i in range(1, radius + 1):
+        for sign in (direction, -direction):
+            x = slider_value + sign * i * step
+            if 0 <= x <= 1:
+                neighbor = to_year(x)
+                if neighbor != year and neighbor not in years:
+                    years.append(neighbor)
+    return years
@@ -0,0 +1,196 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+# Result cache shared by every worker process on the host: a SQLite file in WAL mode
+# (concurrent readers, serialized writers), with an LRU index on the last use of every
+# entry and a size cap. Entries are tagged with the data version they were computed from,
+# and the entries of older versions are dropped once a newer version is seen. Reads never
+# write: hit and miss counts and last-use updates are kept in the process and flushed in
+# one batch every FLUSH_INTERVAL (or with the next write, or at exit). The cache is best
+# effort: when the database is locked or unreadable, lookups miss and writes are skipped.
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'wikimap_cache.sqlite'))
+SHARED_CACHE_MB = int(os.environ.get('SHARED_CACHE_MB', 256))
+TOUCH_INTERVAL = 5.0  # Seconds before a hit updates an entry's last use again
+FLUSH_INTERVAL = 5.0  # Seconds between flushes of the counters and last-use updates
+
+
+class SharedCache:
+    def __init__(self, path=SHARED_CACHE_PATH, max_mb=SHARED_CACHE_MB):
+        self.path = path
+        self.max_bytes = max_mb * 1024 * 1024
+        self.local = threading.local()
+        self.version = None
+        self.recorded_version = None  # Last version this process purged the older entries for
+        self.lock = threading.Lock()
+        self.counts = {}  # namespace -> [hits, misses] not yet flushed
+        self.touches = {}  # key -> last use not yet flushed
+        self.last_flush = time.monotonic()
+        conn = self.connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                version TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                namespace TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.commit()
+        atexit.register(self.flush)
+
+    def connection(self):
+        # One connection per thread; SQLite's file locks coordinate the worker processes
+        if not hasattr(self.local, 'conn'):
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return self.local.conn
+
+    def rollback(self):
+        # Undo the failed operation's writes, if the thread's connection could be opened at all
+        if hasattr(self.local, 'conn'):
+            self.local.conn.rollback()
+
+    def make_key(self, namespace, version, args):
+        return hashlib.sha1(json.dumps([namespace, version, args], default=str).encode('utf-8')).hexdigest()
+
+    def set_version(self, version):
+        # Drop what was computed from other data as soon as a new version shows up, and record
+        # it as the current one, so workers that have not seen it yet stop writing (see put)
+        # Keys include the version, so lookups move to the new one even if recording it fails;
+        # the purge is then retried with the next call
+        self.version = version
+        if version != self.recorded_version:
+            try:
+                conn = self.connection()
+                conn.execute("DELETE FROM entries WHERE version != ?", [version])
+                conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", [version])
+                conn.commit()
+                self.recorded_version = version
+            except sqlite3.Error:
+                self.rollback()
+
+    # get, contains and put use the current version, or the one given (e.g. the version a
+    # prefetch was scheduled under)
+    def get(self, namespace, args, version=None):
+        key = self.make_key(namespace, self.version if version is None else version, args)
+        try:
+            row = self.connection().execute("SELECT value, last_used FROM entries WHERE key = ?", [key]).fetchone()
+        except sqlite3.Error:
+            row = None  # Counted as a miss
+        now = time.time()
+        with self.lock:
+            counts = self.counts.setdefault(namespace, [0, 0])
+            counts[0 if row is not None else 1] += 1
+            if row is not None and now - row[1] > TOUCH_INTERVAL:
+                self.touches[key] = now
+            due = time.monotonic() - self.last_flush > FLUSH_INTERVAL
+        if due:
+            self.flush()
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+    def flush(self, conn=None):
+        # Writes the pending counts and last uses in one transaction (within the caller's if a
+        # connection is given); best effort, so a busy database only delays them
+        with self.lock:
+            counts, touches = self.counts, self.touches
+            self.counts, self.touches = {}, {}
+            self.last_flush = time.monotonic()
+        if not counts and not touches:
+            return
+        commit = conn is None
+        try:
+            conn = conn or self.connection()
+            conn.executemany("INSERT INTO stats (namespace, hits, misses) VALUES (?, ?, ?) "
+                             "ON CONFLICT (namespace) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                             [(namespace, hits, misses) for namespace, (hits, misses) in counts.items()])
+            conn.executemany("UPDATE entries SET last_used = MAX(last_used, ?) WHERE key = ?",
+                             [(last_used, key) for key, last_used in touches.items()])
+            if commit:
+                conn.commit()
+        except sqlite3.Error:
+            if commit:
+                self.rollback()
+            with self.lock:
+                # Keep them for the next flush
+                for namespace, (hits, misses) in counts.items():
+                    pending = self.counts.setdefault(namespace, [0, 0])
+                    pending[0] += hits
+                    pending[1] += misses
+                for key, last_used in touches.items():
+                    self.touches[key] = max(last_used, self.touches.get(key, 0))
+
+    def contains(self, namespace, args, version=None):
+        # Lookup without counting a hit or miss, or touching the entry (for prefetching)
+        key = self.make_key(namespace, self.version if version is None else version, args)
+        try:
+            return self.connection().execute("SELECT 1 FROM entries WHERE key = ?", [key]).fetchone() is not None
+        except sqlite3.Error:
+            return False
+
+    def put(self, namespace, args, value, version=None):
+        # value must be JSON-serializable (or already a JSON string)
+        version = self.version if version is None else version
+        text = value if isinstance(value, str) else json.dumps(value)
+        blob = zlib.compress(text.encode('utf-8'), 1)
+        # Skipped if another worker has seen a newer version since this one last checked, so
+        # entries of a purged version are not written back
+        try:
+            conn = self.connection()
+            written = conn.execute(
+                "INSERT OR REPLACE INTO entries (key, namespace, version, value, size, last_used) "
+                "SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM meta WHERE name = 'version' AND value != ?)",
+                [self.make_key(namespace, version, args), namespace, version, blob, len(blob), time.time(), version]
+            ).rowcount
+            if written:
+                self.evict(conn)
+            self.flush(conn)  # Already in a write transaction
+            conn.commit()
+        except sqlite3.Error:
+            self.rollback()  # The value is simply not cached
+
+    def evict(self, conn):
+        # Remove the least recently used entries until the cache fits its size cap again
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            victims.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+
+    def stats(self):
+        # Hits, misses and hit rate per namespace, summed over all workers (up to their last flush)
+        self.flush()
+        rows = self.connection().execute("SELECT namespace, hits, misses FROM stats").fetchall()
+        entries = self.connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            'namespaces': {namespace: {'hits': hits, 'misses': misses,
+                                       'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+                           for namespace, hits, misses in rows},
+            'entries': entries[0],
+            'bytes': entries[1],
+            'version': self.version,
+        }
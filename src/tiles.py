@@ -0,0 +1,120 @@
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+
+# Scale mode: with a set of pre-built tiles (Data_aggregation/build_tiles.py) in TILES_DIR,
+# the unfiltered map shows only the tiles in view, with the most important figures of each
+# tile, instead of every figure alive in the year. Tiles are memory-mapped, so workers share
+# them through the page cache and only the visible ones are read.
+TILES_DIR = os.environ.get('TILES_DIR')
+POINTS_PER_TILE = int(os.environ.get('TILE_POINTS', 500))
+TILE_SIZE = 512  # Width of the world at zoom 0, in pixels (Mapbox GL)
+VIEW_WIDTH, VIEW_HEIGHT = 1600, 800  # Viewport assumed when the map did not report its bounds
+MAX_LATITUDE = 85.0511
+
+# Same layout as build_tiles.POINT_DTYPE
+POINT_DTYPE = np.dtype([('row', '<i4'), ('lat', '<f4'), ('lon', '<f4'), ('birth', '<i2'), ('death', '<i2')])
+
+
+def mercator_x(lon):
+    return (lon + 180.0) / 360.0
+
+
+def mercator_y(lat):
+    lat = math.radians(min(max(lat, -MAX_LATITUDE), MAX_LATITUDE))
+    return (1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0
+
+
+class TileStore:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.max_zoom = self.meta['max_zoom']
+        self.century = self.meta['century']
+        self.names = np.memmap(os.path.join(directory, 'names.bin'), dtype=np.uint8, mode='r')
+        self.name_offsets = np.load(os.path.join(directory, 'name_offsets.npy'), mmap_mode='r')
+        self.page_ids = np.load(os.path.join(directory, 'page_ids.npy'), mmap_mode='r')
+        self.buckets = {}
+
+    def bucket(self, zoom, century):
+        # Points, tile keys and offsets of one (zoom, century), or None if it has no figures
+        if (zoom, century) not in self.buckets:
+            prefix = os.path.join(self.directory, f'z{zoom}', f'c{century}')
+            if os.path.exists(prefix + '.points.npy'):
+                self.buckets[(zoom, century)] = tuple(
+                    np.load(prefix + suffix, mmap_mode='r') for suffix in ('.points.npy', '.keys.npy', '.offsets.npy'))
+            else:
+                self.buckets[(zoom, century)] = None
+        return self.buckets[(zoom, century)]
+
+    def tile(self, zoom, century, x, y):
+        # Figures of one tile, most important first (none outside the zoom's grid, whose keys
+        # would belong to other tiles)
+        bucket = self.bucket(zoom, century)
+        if bucket is None or not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+            return np.empty(0, dtype=POINT_DTYPE)
+        points, keys, offsets = bucket
+        key = x * 2 ** zoom + y
+        i = int(np.searchsorted(keys, key))
+        if i == len(keys) or keys[i] != key:
+            return np.empty(0, dtype=POINT_DTYPE)
+        return points[offsets[i]:offsets[i + 1]]
+
+    def visible_tiles(self, center, zoom, corners=None):
+        # Tile zoom for the map's zoom, and the tiles covering the view: the corners reported
+        # by the map if there are any, or a typical viewport around the center
+        tile_zoom = min(max(int(zoom + 0.5), 0), self.max_zoom)
+        n = 2 ** tile_zoom
+        if corners:
+            xs = [mercator_x(lon) for lon, _ in corners]
+            ys = [mercator_y(lat) for _, lat in corners]
+            west, east, north, south = min(xs), max(xs), min(ys), max(ys)
+        else:
+            world = TILE_SIZE * 2 ** zoom
+            cx, cy = mercator_x(center['lon']), mercator_y(center['lat'])
+            west, east = cx - VIEW_WIDTH / 2 / world, cx + VIEW_WIDTH / 2 / world
+            north, south = cy - VIEW_HEIGHT / 2 / world, cy + VIEW_HEIGHT / 2 / world
+
+        # Longitudes wrap around; latitudes stop at the edge of the map
+        first_x, last_x = math.floor(west * n), math.floor(east * n)
+        xs = sorted({x % n for x in range(first_x, min(last_x, first_x + n - 1) + 1)})
+        ys = range(min(max(math.floor(north * n), 0), n - 1), min(max(math.floor(south * n), 0), n - 1) + 1)
+        return tile_zoom, [(x, y) for x in xs for y in ys]
+
+    def figures_in_view(self, year, center, zoom, corners=None, limit=POINTS_PER_TILE):
+        # The `limit` most important figures alive in `year` of every visible tile, with the
+        # columns of get_figures_for_year
+        tile_zoom, tiles = self.visible_tiles(center, zoom, corners)
+        century = year // self.century
+        chunks = []
+        for x, y in tiles:
+            points = self.tile(tile_zoom, century, x, y)
+            alive = points[(points['birth'] <= year) & (points['death'] >= year)]
+            chunks.append(alive[:limit])
+        points = np.concatenate(chunks) if chunks else np.empty(0, dtype=POINT_DTYPE)
+
+        rows = points['row'].astype(np.int64)
+        figures = max(self.meta['figures'] - 1, 1)
+        return pd.DataFrame({
+            'page_id': self.page_ids[rows],
+            'article_name': [self.name(row) for row in rows],
+            'birth': points['birth'].astype(int),
+            'death': [None if death == self.meta['alive'] else death for death in points['death'].tolist()],
+            'latitude': points['lat'].astype(float),
+            'longitude': points['lon'].astype(float),
+            # Same scale as csv_to_sql_format.calculate_color_value (rows are in rank order)
+            'color_value': 1.0 - rows / figures,
+        })
+
+    def name(self, row):
+        return bytes(self.names[self.name_offsets[row]:self.name_offsets[row + 1]]).decode('utf-8')
+
+
+def open_tile_store(directory=TILES_DIR):
+    # None (scale mode off) unless a built set of tiles is configured
+    if directory and os.path.exists(os.path.join(directory, 'meta.json')):
+        return TileStore(directory)
+    return None
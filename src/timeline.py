@@ -0,0 +1,68 @@
+import functools
+import numpy as np
+import pandas as pd
+from data_processing import get_timeline_figures
+
+# Timeline playback sweeps the map from one year to the next without a server round trip
+# per frame: the figures of an occupation are sent once, with the frames in which each one
+# enters and leaves the map, and the browser (assets/timeline.js) applies those deltas.
+FRAME_CACHE_SIZE = 32
+
+# Frames of one (occupation, step): frame k shows the figures alive in years[k].
+# Figures are numbered in the order of `points`; `enter` and `leave` hold the numbers of
+# the figures that appear and disappear in every frame, in CSR form (frame k's figures
+# are enter[enter_offsets[k]:enter_offsets[k + 1]]). data_version only keys the cache.
+@functools.lru_cache(maxsize=FRAME_CACHE_SIZE)
+def get_timeline_frames(selected_occupation, step, min_year, max_year, data_version=None):
+    df = get_timeline_figures(selected_occupation)
+    years = np.arange(min_year, max_year + 1, step)
+    if years[-1] != max_year:
+        years = np.append(years, max_year)
+
+    births = pd.to_numeric(df['birth']).to_numpy(dtype=float)
+    deaths = pd.to_numeric(df['death']).to_numpy(dtype=float)
+    # A death of NULL or 0 means still alive (as in get_figures_for_year)
+    ends = np.where(np.isnan(deaths) | (deaths == 0), np.inf, deaths)
+
+    # First frame whose year is not before the birth, last frame not after the death
+    first = np.searchsorted(years, births, side='left')
+    last = np.searchsorted(years, ends, side='right') - 1
+    shown = first <= last
+    df, first, last = df[shown].reset_index(drop=True), first[shown], last[shown]
+
+    enter_offsets, enter = group_by_frame(first, len(years))
+    leaving = last + 1 < len(years)
+    leave_offsets, leave = group_by_frame(last[leaving] + 1, len(years))
+    leave = np.flatnonzero(leaving)[leave]
+
+    return {
+        'token': f'{selected_occupation}|{step}|{min_year}|{max_year}',
+        'years': years.tolist(),
+        'min_year': min_year,
+        'max_year': max_year,
+        'points': {
+            'name': df['article_name'].tolist(),
+            'lat': np.round(pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=float), 4).tolist(),
+            'lon': np.round(pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=float), 4).tolist(),
+            'color': np.round(pd.to_numeric(df['color_value'], errors='coerce').to_numpy(dtype=float), 4).tolist(),
+            'birth': df['birth'].astype(str).tolist(),
+            'death': df['death'].fillna('').astype(str).tolist(),
+        },
+        'first': first.tolist(),
+        'last': last.tolist(),
+        'enter_offsets': enter_offsets.tolist(),
+        'enter': enter.tolist(),
+        'leave_offsets': leave_offsets.tolist(),
+        'leave': leave.tolist(),
+    }
+
+def group_by_frame(frames, n_frames):
+    # Indices sorted by frame, and the offset of every frame's run of indices
+    order = np.argsort(frames, kind='stable')
+    offsets = np.zeros(n_frames + 1, dtype=np.int64)
+    np.cumsum(np.bincount(frames, minlength=n_frames), out=offsets[1:])
+    return offsets, order
+
+def frame_at_year(frames, year):
+    # Frame shown when playback starts from `year`
+    return max(int(np.searchsorted(frames['years'], year, side='right')) - 1, 0)